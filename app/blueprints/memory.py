@@ -4,8 +4,10 @@ Memory API Blueprint
 Handles memory operations, network visualization, and memory search.
 """
 
+import numpy as np
 from flask import Blueprint, request, jsonify
 from config import config
+from app.utils.json_response import json_response
 
 memory_bp = Blueprint('memory', __name__)
 
@@ -126,15 +128,20 @@ def memory_network():
                 'error': 'Memory system not available'
             })
         
-        user_memories = mem_manager.get_user_memories(user_id, 1000)
+        from app.core.user_memory_store import MEMORY_CORE_FIELDS
+        user_memories = mem_manager.get_user_memories(user_id, 1000, MEMORY_CORE_FIELDS)
         print(f"[MEMORY] Found {len(user_memories)} memories for user '{user_id}'")
         
         # Calculate scores and create nodes
         nodes = []
         edges = []
         
-        for memory in user_memories:
-            score = _calculate_memory_score(memory, user_memories)
+        from app.core.memory_math import compute_all_effective_strengths
+        strengths = compute_all_effective_strengths(user_memories)
+        total_strength = sum(max(0.0, s) for s in strengths)
+        
+        for memory, effective in zip(user_memories, strengths):
+            score = _calculate_memory_score(effective, total_strength)
             nodes.append({
                 'id': memory['id'],
                 'label': memory['content'][:50] + ('...' if len(memory['content']) > 50 else ''),
@@ -145,28 +152,25 @@ def memory_network():
                 'size': 20 + min(score, 100) * 0.5,
             })
         
-        # Calculate connections
-        for i, memory1 in enumerate(user_memories):
-            for j, memory2 in enumerate(user_memories):
-                if i >= j:
-                    continue
-                
-                similarity = _calculate_similarity(memory1, memory2)
-                
-                if similarity > threshold:
-                    edges.append({
-                        'from': memory1['id'],
-                        'to': memory2['id'],
-                        'value': similarity,
-                        'label': f'{similarity:.2f}',
-                        'color': {
-                            'color': '#4CAF50' if similarity > 0.6 else 
-                                    '#FFC107' if similarity > 0.4 else 
-                                    '#FF9800'
-                        }
-                    })
+        # Calculate connections: score every pair at once, then walk the upper
+        # triangle row by row (same edge order as a nested i < j loop)
+        similarities = _similarity_matrix(user_memories)
+        pair_i, pair_j = np.nonzero(np.triu(similarities > threshold, k=1))
+        for i, j, similarity in zip(pair_i.tolist(), pair_j.tolist(), similarities[pair_i, pair_j].tolist()):
+            edges.append({
+                'from': user_memories[i]['id'],
+                'to': user_memories[j]['id'],
+                'value': similarity,
+                'label': f'{similarity:.2f}',
+                'color': {
+                    'color': '#4CAF50' if similarity > 0.6 else 
+                            '#FFC107' if similarity > 0.4 else 
+                            '#FF9800'
+                }
+            })
         
-        return jsonify({
+        # The node/edge payload grows quadratically, so use the fast encoder
+        return json_response({
             'nodes': nodes,
             'edges': edges,
             'user_specific': True,
@@ -281,50 +285,48 @@ def search_user_memories():
         return jsonify({'error': 'Failed to search memories'}), 500
 
 
-def _calculate_memory_score(memory, all_memories):
-    """Node strength from the four-stage memory model (encoding → recall → sleep → forgetting)."""
-    from app.core.memory_math import (
-        compute_effective_strength,
-        recall_probability,
-        compute_all_effective_strengths,
-    )
-    strengths = compute_all_effective_strengths(all_memories)
-    effective = compute_effective_strength(memory)
-    recall_p = recall_probability(effective, strengths)
+def _calculate_memory_score(effective, total_strength):
+    """
+    Node strength from the four-stage memory model (encoding → recall → sleep → forgetting).
+    `effective` is the node's decayed strength and `total_strength` is ΣS over all nodes,
+    both computed once per request by the caller.
+    """
+    recall_p = max(0.0, effective) / total_strength if total_strength > 0 else 0.0
     # Display score blends decayed strength with relative recall probability
     return max(5.0, effective * 0.75 + recall_p * 100 * 0.25)
 
 
-def _calculate_similarity(memory1, memory2):
-    """Calculate similarity between two memories"""
-    # Tag similarity
-    tags1 = set(memory1.get('tags', []))
-    tags2 = set(memory2.get('tags', []))
-    
-    if not tags1 or not tags2:
-        tag_similarity = 0
-    else:
-        shared_tags = len(tags1 & tags2)
-        total_unique_tags = len(tags1 | tags2)
-        tag_similarity = (shared_tags / total_unique_tags) * 2
-    
-    # Content similarity
-    content1 = memory1['content'].lower()
-    content2 = memory2['content'].lower()
-    
-    common_words = {'i', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for'}
-    words1 = set(word.strip('.,!?;:') for word in content1.split() if word.lower() not in common_words and len(word) > 2)
-    words2 = set(word.strip('.,!?;:') for word in content2.split() if word.lower() not in common_words and len(word) > 2)
-    
-    if not words1 or not words2:
-        content_similarity = 0
-    else:
-        shared_words = len(words1 & words2)
-        total_unique_words = len(words1 | words2)
-        content_similarity = shared_words / total_unique_words
-    
-    return (tag_similarity * 0.5) + (content_similarity * 0.5)
+_COMMON_WORDS = frozenset({'i', 'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for'})
 
 
+def _similarity_terms(memory):
+    """Tag set and filtered content word set of a memory, built once per request"""
+    content = memory['content'].lower()
+    words = set(word.strip('.,!?;:') for word in content.split() if word not in _COMMON_WORDS and len(word) > 2)
+    return set(memory.get('tags', [])), words
 
 
+def _jaccard_matrix(term_sets):
+    """Pairwise |A ∩ B| / |A ∪ B| over term sets; 0 wherever either set is empty"""
+    vocab = {}
+    rows, cols = [], []
+    for i, terms in enumerate(term_sets):
+        for term in terms:
+            rows.append(i)
+            cols.append(vocab.setdefault(term, len(vocab)))
+    incidence = np.zeros((len(term_sets), len(vocab)), dtype=np.float32)
+    incidence[rows, cols] = 1.0
+    # Shared counts are small integers, exact in float32; divide in float64
+    shared = (incidence @ incidence.T).astype(np.float64)
+    sizes = np.fromiter((len(terms) for terms in term_sets), dtype=np.float64, count=len(term_sets))
+    union = np.add.outer(sizes, sizes) - shared
+    nonempty = sizes > 0
+    return np.divide(shared, union, out=np.zeros_like(shared), where=np.outer(nonempty, nonempty))
+
+
+def _similarity_matrix(memories):
+    """Pairwise memory similarity: tag overlap (weighted x2) and content word overlap, averaged"""
+    terms = [_similarity_terms(memory) for memory in memories]
+    tag_similarity = _jaccard_matrix([tags for tags, _ in terms]) * 2
+    content_similarity = _jaccard_matrix([words for _, words in terms])
+    return (tag_similarity * 0.5) + (content_similarity * 0.5)
@@ -11,7 +11,9 @@ import jwt
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify, session
-from supabase import create_client, Client
+from supabase import Client
+from app.core.supabase_client import get_supabase_client
+from app.core.user_memory_store import MEMORY_CORE_FIELDS, iter_user_memories
 from typing import Optional, Dict, Any
 
 class MonetaAuthSystem:
@@ -29,7 +31,7 @@ class MonetaAuthSystem:
         if not self.supabase_url or not self.supabase_key:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY environment variables are required")
         
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+        self.supabase: Client = get_supabase_client(self.supabase_url, self.supabase_key)
         
         # Initialize database tables
         self._initialize_database()
@@ -273,42 +275,60 @@ class UserMemoryManager:
     
     def add_memory_for_user(self, user_id: str, content: str, tags: list = None) -> Dict[str, Any]:
         """Add a memory to user's personal database."""
+        result = self.add_memories_for_user(user_id, [content], tags)
+        if result['success']:
+            return {
+                'success': True,
+                'memory': result['memories'][0]
+            }
+        return {
+            'success': False,
+            'error': 'Failed to add memory'
+        }
+    
+    def add_memories_for_user(self, user_id: str, contents: list, tags: list = None) -> Dict[str, Any]:
+        """Add several memories to user's personal database with one insert."""
+        if not contents:
+            return {'success': True, 'memories': []}
         try:
             from app.core.memory_math import initial_memory_state
-            encoded = initial_memory_state(content, tags)
-            memory_data = {
-                'user_id': user_id,
-                'content': content,
-                'tags': encoded['tags'],
-                'score': encoded['score'],
-                'created_at': datetime.utcnow().isoformat(),
-                'last_accessed': encoded['last_accessed'],
-                'access_count': encoded['access_count'],
-            }
+            created_at = datetime.utcnow().isoformat()
+            rows = []
+            for content in contents:
+                encoded = initial_memory_state(content, tags)
+                rows.append({
+                    'user_id': user_id,
+                    'content': content,
+                    'tags': encoded['tags'],
+                    'score': encoded['score'],
+                    'created_at': created_at,
+                    'last_accessed': encoded['last_accessed'],
+                    'access_count': encoded['access_count'],
+                })
             
-            result = self.supabase.table('user_memories').insert(memory_data).execute()
+            result = self.supabase.table('user_memories').insert(rows).execute()
             
             if result.data:
-                # Update memory count for user
+                # Update memory count for user once for the whole batch
                 self._update_user_memory_count(user_id)
                 return {
                     'success': True,
-                    'memory': result.data[0]
+                    'memories': result.data
                 }
             else:
                 return {
                     'success': False,
-                    'error': 'Failed to add memory'
+                    'error': 'Failed to add memories'
                 }
                 
         except Exception as e:
-            print(f"Error adding memory for user {user_id}: {e}")
+            print(f"Error adding memories for user {user_id}: {e}")
             return {
                 'success': False,
-                'error': 'Failed to add memory'
+                'error': 'Failed to add memories'
             }
     
-    def get_user_memories(self, user_id: str, limit: int = 50) -> list:
+    def get_user_memories(self, user_id: str, limit: Optional[int] = 50, fields: str = '*') -> list:
         """Get all memories for a specific user with forgetting/sleep strength applied."""
         try:
             from app.core.memory_math import (
@@ -316,8 +336,9 @@ class UserMemoryManager:
                 needs_sleep_consolidation,
                 apply_consolidation_update,
             )
-            result = self.supabase.table('user_memories').select('*').eq('user_id', user_id).order('score', desc=True).limit(limit).execute()
-            memories = result.data if result.data else []
+            # Read every page before persisting anything: strength writes change
+            # `score`, which the pages are ordered by, and would shift rows between pages
+            memories = list(iter_user_memories(self.supabase, user_id, fields, limit))
             updated = []
             for memory in memories:
                 if needs_sleep_consolidation(memory.get('last_accessed')):
@@ -339,7 +360,7 @@ class UserMemoryManager:
             from app.core.memory_math import rank_memories_for_recall, apply_recall_update
             print(f"[SEARCH] Searching user memories for: '{query}'")
 
-            all_memories = self.get_user_memories(user_id, 1000)
+            all_memories = self.get_user_memories(user_id, None, MEMORY_CORE_FIELDS)
             if not all_memories:
                 return []
 
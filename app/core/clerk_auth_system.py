@@ -10,7 +10,9 @@ from datetime import datetime
 from functools import wraps
 from flask import request, jsonify
 from typing import Optional, Dict, Any
-from supabase import create_client, Client
+from supabase import Client
+from app.core.supabase_client import get_supabase_client
+from app.core.user_memory_store import MEMORY_CORE_FIELDS, iter_user_memories
 
 try:
     from clerk_backend_sdk import Configuration, ApiClient
@@ -58,7 +60,7 @@ class ClerkAuthSystem:
             raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY environment variables are required")
         
         # Use service key for admin operations (creating users)
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_service_key)
+        self.supabase: Client = get_supabase_client(self.supabase_url, self.supabase_service_key)
         
         print("[INFO] Clerk Authentication System initialized")
         print(f"[INFO] Clerk Publishable Key: {self.clerk_publishable_key[:20]}...")
@@ -299,7 +301,7 @@ class ClerkUserMemoryManager:
                 'error': 'Failed to add memory'
             }
     
-    def get_user_memories(self, user_id: str, limit: int = 50) -> list:
+    def get_user_memories(self, user_id: str, limit: Optional[int] = 50, fields: str = '*') -> list:
         """Get all memories for a specific user with forgetting/sleep strength applied."""
         try:
             from app.core.memory_math import (
@@ -307,8 +309,9 @@ class ClerkUserMemoryManager:
                 needs_sleep_consolidation,
                 apply_consolidation_update,
             )
-            result = self.supabase.table('user_memories').select('*').eq('user_id', user_id).order('score', desc=True).limit(limit).execute()
-            memories = result.data if result.data else []
+            # Read every page before persisting anything: strength writes change
+            # `score`, which the pages are ordered by, and would shift rows between pages
+            memories = list(iter_user_memories(self.supabase, user_id, fields, limit))
             updated = []
             for memory in memories:
                 if needs_sleep_consolidation(memory.get('last_accessed')):
@@ -330,7 +333,7 @@ class ClerkUserMemoryManager:
             from app.core.memory_math import rank_memories_for_recall, apply_recall_update
             print(f"[SEARCH] Searching user memories for: '{query}'")
 
-            all_memories = self.get_user_memories(user_id, 1000)
+            all_memories = self.get_user_memories(user_id, None, MEMORY_CORE_FIELDS)
             if not all_memories:
                 return []
 
@@ -10,7 +10,8 @@ import jwt
 from jwt import PyJWKClient
 from typing import Optional, Dict, Any
 from datetime import datetime
-from supabase import create_client, Client
+from supabase import Client
+from app.core.supabase_client import get_supabase_client
 
 
 class ClerkRestAPI:
@@ -80,7 +81,7 @@ class ClerkRestAPI:
         if not self.supabase_url or not self.supabase_service_key:
             raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY required")
         
-        self.supabase: Client = create_client(self.supabase_url, self.supabase_service_key)
+        self.supabase: Client = get_supabase_client(self.supabase_url, self.supabase_service_key)
         
         print("[OK] Clerk REST API initialized (no async issues!)")
     
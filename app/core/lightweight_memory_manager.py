@@ -15,11 +15,15 @@ DEPRECATED: Lightweight Memory Manager (Fallback Only)
     This lightweight version provides basic memory functionality using simple text matching.
 """
 
-import json
+import atexit
+import hashlib
 import os
-import re
+import tempfile
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
 
 from app.core.memory_math import (
     initial_memory_state,
@@ -27,6 +31,10 @@ from app.core.memory_math import (
     rank_memories_for_recall,
     apply_recall_update,
 )
+from app.utils import fast_json
+
+# Writes arriving within this window are coalesced into a single save
+SAVE_DEBOUNCE_SECONDS = 0.5
 
 class LightweightMemoryManager:
     """
@@ -38,14 +46,35 @@ class LightweightMemoryManager:
     def __init__(self, memory_file='memory_data.json'):
         self.memory_file = memory_file
         self.memories = []
+        # Bumped whenever memories are loaded, added, deleted or reinforced so
+        # callers can tell when derived data (e.g. the network graph) is stale
+        self.revision = 0
+        # blake2b(content) -> word set; kept across reloads so only new or edited
+        # memories get re-tokenized when the connection graph is rebuilt
+        self._token_cache: Dict[str, frozenset] = {}
+        # (content keys in row order, similarity matrix); appends only compute the
+        # new rows against it. Kept as one tuple and replaced in a single assignment
+        # so a concurrent reader never pairs one call's keys with another's matrix
+        self._sim_cache: Tuple[List[str], Optional[np.ndarray]] = ([], None)
+        # memory id -> position in self.memories, rebuilt lazily when stale
+        self._id_index: Dict[str, int] = {}
+        self._save_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        self._write_lock = threading.Lock()
+        # mtime of the memory file as of our last read or write
+        self._file_mtime_ns: Optional[int] = None
         self.load_memories()
+        atexit.register(self.flush)
     
     def load_memories(self):
         """Load memories from JSON file"""
+        # Stat before reading so a write racing with the read is caught next time
+        self._file_mtime_ns = self._current_file_mtime_ns()
         try:
             if os.path.exists(self.memory_file):
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    self.memories = json.load(f)
+                with open(self.memory_file, 'rb') as f:
+                    raw = f.read()
+                self.memories = fast_json.loads(raw)
                 print(f"✅ Loaded {len(self.memories)} memories")
             else:
                 self.memories = []
@@ -53,16 +82,88 @@ class LightweightMemoryManager:
         except Exception as e:
             print(f"⚠️  Error loading memories: {e}")
             self.memories = []
+        self._id_index = {}
+        self.revision += 1
+        self._prune_token_cache()
+    
+    @staticmethod
+    def _content_key(content: str) -> str:
+        """Stable cache key for a memory's content (edits invalidate cleanly)."""
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _tokens_for(self, memory: Dict[str, Any], key: Optional[str] = None) -> frozenset:
+        """Lowercased word set for a memory, tokenized once per distinct content."""
+        content = memory.get('content', '')
+        key = key or self._content_key(content)
+        tokens = self._token_cache.get(key)
+        if tokens is None:
+            tokens = frozenset(content.lower().split())
+            self._token_cache[key] = tokens
+        return tokens
+    
+    def _index_of(self, memory_id: str) -> Optional[int]:
+        """Position of a memory in self.memories, or None; O(1) unless the index is stale."""
+        i = self._id_index.get(memory_id)
+        if i is None or i >= len(self.memories) or self.memories[i]['id'] != memory_id:
+            self._id_index = {}
+            for position, memory in enumerate(self.memories):
+                self._id_index.setdefault(memory['id'], position)
+            i = self._id_index.get(memory_id)
+        return i
+    
+    def _prune_token_cache(self):
+        """Drop cached word sets for memories that no longer exist."""
+        live = {self._content_key(m.get('content', '')) for m in self.memories}
+        for key in [k for k in self._token_cache if k not in live]:
+            del self._token_cache[key]
     
     def save_memories(self):
         """Save memories to JSON file"""
         try:
-            with open(self.memory_file, 'w', encoding='utf-8') as f:
-                json.dump(self.memories, f, indent=2, ensure_ascii=False)
+            # One writer at a time; each save goes to its own temp file (unique across
+            # processes), is fsynced, then swapped in atomically so a concurrent
+            # reload or a crash never leaves a half-written memory file
+            with self._write_lock:
+                data = fast_json.dumps(list(self.memories))
+                fd, tmp_file = tempfile.mkstemp(
+                    dir=os.path.dirname(os.path.abspath(self.memory_file)),
+                    prefix=f".{os.path.basename(self.memory_file)}.", suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_file, self.memory_file)
+                except BaseException:
+                    try:
+                        os.remove(tmp_file)
+                    except OSError:
+                        pass
+                    raise
+                self._file_mtime_ns = self._current_file_mtime_ns()
             print(f"💾 Saved {len(self.memories)} memories")
         except Exception as e:
             print(f"❌ Error saving memories: {e}")
     
+    def _schedule_save(self):
+        """Debounce saves so a burst of writes causes one file rewrite instead of many."""
+        with self._save_lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(SAVE_DEBOUNCE_SECONDS, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def flush(self):
+        """Write pending changes to disk now (no-op when nothing is pending)."""
+        with self._save_lock:
+            pending = self._save_timer is not None
+            if pending:
+                self._save_timer.cancel()
+                self._save_timer = None
+        if pending:
+            self.save_memories()
+    
     def add_memory(self, content: str, metadata: Dict[str, Any] = None) -> str:
         """Add a new memory (encoding stage: first repetition)."""
         memory_id = f"mem_{len(self.memories)}_{int(datetime.now().timestamp())}"
@@ -79,7 +180,9 @@ class LightweightMemoryManager:
         }
         
         self.memories.append(memory)
-        self.save_memories()
+        self._id_index.setdefault(memory_id, len(self.memories) - 1)
+        self.revision += 1
+        self._schedule_save()
         
         print(f"🧠 Added memory: {memory_id}")
         return memory_id
@@ -97,11 +200,10 @@ class LightweightMemoryManager:
 
         results = []
         for memory in filtered[:top_k]:
-            idx = next((i for i, m in enumerate(self.memories) if m['id'] == memory['id']), None)
+            idx = self._index_of(memory['id'])
             if idx is not None:
                 self.memories[idx] = apply_recall_update(self.memories[idx])
                 memory = self.memories[idx]
-            self.save_memories()
 
             eff = compute_effective_strength(memory)
             results.append({
@@ -110,22 +212,26 @@ class LightweightMemoryManager:
                 'final_score': memory.get('search_score', eff / 100.0),
             })
 
+        if results:
+            self.revision += 1
+            self._schedule_save()
         return results
     
     def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific memory by ID"""
-        for memory in self.memories:
-            if memory['id'] == memory_id:
-                self._update_access_count(memory_id)
-                return memory
-        return None
+        i = self._index_of(memory_id)
+        if i is None:
+            return None
+        memory = self.memories[i]
+        self._update_access_count(memory_id)
+        return memory
     
     def _update_access_count(self, memory_id: str):
         """Update access count and strength after recall."""
-        for i, memory in enumerate(self.memories):
-            if memory['id'] == memory_id:
-                self.memories[i] = apply_recall_update(memory)
-                break
+        i = self._index_of(memory_id)
+        if i is not None:
+            self.memories[i] = apply_recall_update(self.memories[i])
+            self.revision += 1
     
     def get_recent_memories(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get most recent memories"""
@@ -143,13 +249,17 @@ class LightweightMemoryManager:
     
     def delete_memory(self, memory_id: str) -> bool:
         """Delete a memory"""
-        for i, memory in enumerate(self.memories):
-            if memory['id'] == memory_id:
-                del self.memories[i]
-                self.save_memories()
-                print(f"🗑️  Deleted memory: {memory_id}")
-                return True
-        return False
+        i = self._index_of(memory_id)
+        if i is None:
+            return False
+        memory = self.memories.pop(i)
+        self._id_index = {}  # Later positions shifted
+        self._token_cache.pop(self._content_key(memory.get('content', '')), None)
+        self._drop_similarity_row(i)
+        self.revision += 1
+        self._schedule_save()
+        print(f"🗑️  Deleted memory: {memory_id}")
+        return True
     
     def get_memory_stats(self) -> Dict[str, Any]:
         """Get memory statistics"""
@@ -170,51 +280,116 @@ class LightweightMemoryManager:
     
     def reload_from_disk(self):
         """Reload memories from disk (for compatibility)"""
+        self.flush()
         self.load_memories()
     
+    def _current_file_mtime_ns(self) -> Optional[int]:
+        """mtime of the memory file in ns, or None if it doesn't exist."""
+        try:
+            return os.stat(self.memory_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    def reload_if_changed(self) -> bool:
+        """Reload from disk only if the file changed since we last read or wrote it."""
+        if self._current_file_mtime_ns() == self._file_mtime_ns:
+            return False
+        self.reload_from_disk()
+        return True
+    
     def _get_all_memories_flat(self) -> List[Dict[str, Any]]:
         """Get all memories in flat format (for compatibility)"""
         return self.memories
     
+    @staticmethod
+    def _build_term_matrix(word_sets: List[frozenset], start: int = 0) -> np.ndarray:
+        """
+        Binary memory × word incidence matrix (C-contiguous float32, so overlaps go through BLAS).
+        Only words that can add to an overlap involving rows[start:] get a column: a word held
+        by a single memory never overlaps, and pairs among earlier rows are already known.
+        """
+        doc_freq: Dict[str, int] = {}
+        for words in word_sets:
+            for word in words:
+                doc_freq[word] = doc_freq.get(word, 0) + 1
+        new_words = set().union(*word_sets[start:])
+        vocab: Dict[str, int] = {}
+        rows, cols = [], []
+        for i, words in enumerate(word_sets):
+            for word in words:
+                if doc_freq[word] > 1 and word in new_words:
+                    rows.append(i)
+                    cols.append(vocab.setdefault(word, len(vocab)))
+        term_matrix = np.zeros((len(word_sets), len(vocab)), dtype=np.float32)
+        term_matrix[rows, cols] = 1.0
+        return term_matrix
+    
+    @classmethod
+    def _jaccard_rows(cls, word_sets: List[frozenset], start: int = 0) -> np.ndarray:
+        """|A ∩ B| / |A ∪ B| of word_sets[start:] against every set; 0 where both sets are empty."""
+        term_matrix = cls._build_term_matrix(word_sets, start)
+        # Counts are small integers, exact in float32; divide in float64 for exact ratios
+        overlap = (term_matrix[start:] @ term_matrix.T).astype(np.float64)
+        sizes = np.fromiter((len(words) for words in word_sets), dtype=np.float64, count=len(word_sets))
+        union = np.add.outer(sizes[start:], sizes)
+        union -= overlap
+        # Divide in place: where the union is empty the overlap is already 0
+        return np.divide(overlap, union, out=overlap, where=union > 0)
+    
+    def _similarity_matrix(self) -> np.ndarray:
+        """
+        Pairwise word-overlap similarity of the current memories (diagonal = 1).
+        If memories were only appended since the last call, just the new rows are computed.
+        """
+        keys = [self._content_key(memory.get('content', '')) for memory in self.memories]
+        n = len(keys)
+        cached_keys, cached_matrix = self._sim_cache
+        known = len(cached_keys)
+        start = 0
+        if cached_matrix is not None and keys[:known] == cached_keys:
+            if known == n:
+                return cached_matrix
+            start = known
+
+        word_sets = [self._tokens_for(memory, key) for memory, key in zip(self.memories, keys)]
+        new_rows = self._jaccard_rows(word_sets, start)
+        sim_matrix = np.empty((n, n), dtype=np.float64)
+        if start:
+            sim_matrix[:start, :start] = cached_matrix
+        sim_matrix[start:, :] = new_rows
+        sim_matrix[:start, start:] = new_rows[:, :start].T
+        np.fill_diagonal(sim_matrix, 1.0)  # Self-similarity
+
+        self._sim_cache = (keys, sim_matrix)
+        return sim_matrix
+    
+    def _drop_similarity_row(self, index: int):
+        """Remove one memory's row and column from the cached similarity matrix."""
+        cached_keys, cached_matrix = self._sim_cache
+        if cached_matrix is not None and index < len(cached_keys):
+            keep = np.arange(len(cached_keys)) != index
+            self._sim_cache = (cached_keys[:index] + cached_keys[index + 1:], cached_matrix[np.ix_(keep, keep)])
+    
     def _calculate_all_scores_and_connections(self, threshold: float = 0.3):
         """Calculate memory connections and apply strength model to each node."""
-        connections = []
-        sim_matrix = []
-
         n = len(self.memories)
         for i in range(n):
             eff = compute_effective_strength(self.memories[i])
             self.memories[i]['score'] = round(eff, 4)
 
-        for i in range(n):
-            row_connections = []
-            sim_row = []
-            
-            for j in range(n):
-                if i != j:
-                    # Simple similarity based on common words
-                    content_i = self.memories[i]['content'].lower()
-                    content_j = self.memories[j]['content'].lower()
-                    
-                    words_i = set(content_i.split())
-                    words_j = set(content_j.split())
-                    
-                    if words_i and words_j:
-                        similarity = len(words_i.intersection(words_j)) / len(words_i.union(words_j))
-                    else:
-                        similarity = 0
-                    
-                    sim_row.append(similarity)
-                    
-                    if similarity >= threshold:
-                        row_connections.append((j, similarity))
-                else:
-                    sim_row.append(1.0)  # Self-similarity
-            
-            connections.append(row_connections)
-            sim_matrix.append(sim_row)
-        
-        return connections, sim_matrix
+        # Simple similarity based on common words
+        sim_matrix = self._similarity_matrix()
+
+        # Threshold every pair at once; walking the upper triangle row by row keeps
+        # each node's neighbour list in ascending index order
+        mask = sim_matrix >= threshold
+        i_idx, j_idx = np.nonzero(np.triu(mask, k=1))
+        connections = [[] for _ in range(n)]
+        for i, j, similarity in zip(i_idx.tolist(), j_idx.tolist(), sim_matrix[i_idx, j_idx].tolist()):
+            connections[i].append((j, similarity))
+            connections[j].append((i, similarity))
+
+        return connections, sim_matrix.tolist()
 
 # Alias for compatibility
 MemoryManager = LightweightMemoryManager 
\ No newline at end of file
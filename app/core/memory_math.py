@@ -10,6 +10,7 @@ Mathematics of Memory — four-stage strength model.
 
 from __future__ import annotations
 
+import heapq
 import math
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, Union
@@ -174,6 +175,7 @@ def compute_all_effective_strengths(
     memories: List[Dict[str, Any]],
     now: Optional[datetime] = None,
 ) -> List[float]:
+    now = now or datetime.now(timezone.utc)
     return [compute_effective_strength(m, now) for m in memories]
 
 
@@ -232,10 +234,11 @@ def rank_memories_for_recall(
     }
 
     effective_strengths = compute_all_effective_strengths(memories, now)
-    total_strength = sum(effective_strengths)
+    # ΣS is shared by every candidate, so compute it once rather than per memory
+    total_strength = sum(max(0.0, s) for s in effective_strengths)
 
-    ranked = []
-    for memory, eff_strength in zip(memories, effective_strengths):
+    candidates = []
+    for index, (memory, eff_strength) in enumerate(zip(memories, effective_strengths)):
         content = memory.get('content', '').lower()
         if not content:
             continue
@@ -250,14 +253,16 @@ def rank_memories_for_recall(
         if relevance <= 0:
             continue
 
-        recall_p = recall_probability(eff_strength, effective_strengths) if total_strength > 0 else 0.0
+        recall_p = max(0.0, eff_strength) / total_strength if total_strength > 0 else 0.0
         final_score = relevance * 0.6 + recall_p * 0.4
+        candidates.append((round(final_score, 6), index, eff_strength, recall_p))
 
-        entry = dict(memory)
+    # Partial top-k (same order as a stable descending sort); only the winners are copied
+    ranked = []
+    for search_score, index, eff_strength, recall_p in heapq.nlargest(limit, candidates, key=lambda c: c[0]):
+        entry = dict(memories[index])
         entry['effective_strength'] = round(eff_strength, 4)
         entry['recall_probability'] = round(recall_p, 6)
-        entry['search_score'] = round(final_score, 6)
+        entry['search_score'] = search_score
         ranked.append(entry)
-
-    ranked.sort(key=lambda m: m['search_score'], reverse=True)
-    return ranked[:limit]
+    return ranked
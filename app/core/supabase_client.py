@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Shared Supabase client so every service reuses the same pooled HTTP connections
+instead of each paying its own TCP + TLS handshakes
+"""
+
+from threading import Lock
+from typing import Dict, Tuple
+from supabase import create_client, Client
+from supabase.client import ClientOptions
+
+# PostgREST calls fail after this many seconds instead of the client's 120s default,
+# so a stalled request cannot pin a request thread or background writer for minutes
+POSTGREST_TIMEOUT_SECONDS = 30
+
+# One client per (project URL, API key) — the anon and service-role keys stay separate
+_clients: Dict[Tuple[str, str], Client] = {}
+_clients_lock = Lock()
+
+def get_supabase_client(url: str, key: str) -> Client:
+    """Get the process-wide Supabase client for this URL/key, creating it on first use"""
+    with _clients_lock:
+        client = _clients.get((url, key))
+        if client is None:
+            client = create_client(url, key, options=ClientOptions(postgrest_client_timeout=POSTGREST_TIMEOUT_SECONDS))
+            _clients[(url, key)] = client
+        return client
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Shared reads of the user_memories table for the legacy and Clerk memory managers
+"""
+
+from typing import Optional
+from supabase import Client
+
+# Supabase's PostgREST caps each response at 1000 rows; larger reads are paged
+MEMORY_PAGE_SIZE = 1000
+# Columns the strength model, recall search and network view actually read
+MEMORY_CORE_FIELDS = 'id, content, tags, score, access_count, last_accessed, created_at'
+
+def iter_user_memories(supabase: Client, user_id: str, fields: str = '*', limit: Optional[int] = None):
+    """
+    Yield a user's memory rows page by page (all rows when limit is None),
+    selecting only `fields` and paging past PostgREST's per-request row cap.
+    """
+    offset = 0
+    while limit is None or offset < limit:
+        page_size = MEMORY_PAGE_SIZE if limit is None else min(MEMORY_PAGE_SIZE, limit - offset)
+        result = supabase.table('user_memories').select(fields).eq('user_id', user_id) \
+            .order('score', desc=True).order('id').range(offset, offset + page_size - 1).execute()
+        page = result.data or []
+        yield from page
+        if len(page) < page_size:
+            return
+        offset += page_size
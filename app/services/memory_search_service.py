@@ -1,8 +1,24 @@
 #!/usr/bin/env python3
 
+import time
+from threading import Lock
+from urllib.parse import quote
+
 import requests
+from requests.adapters import HTTPAdapter
 from config import config
 
+# Keep-alive connection pool for the local search API fallback
+_SESSION = requests.Session()
+_SESSION.mount('http://', HTTPAdapter(pool_connections=8, pool_maxsize=32))
+
+# Network data is reused until the memories change; the TTL bounds how stale the
+# time-decayed node scores can get between changes
+NETWORK_CACHE_TTL_SECONDS = 30
+
+# Edge colour with the similarity (capped at 1) as alpha; 3 decimals is plenty for CSS
+_EDGE_RGBA = 'rgba(168,85,247,{:.3f})'.format
+
 class MemorySearchService:
     """Service for searching and filtering memories"""
     
@@ -12,6 +28,10 @@ class MemorySearchService:
         self.min_relevance = config.min_relevance_threshold
         self.max_results = config.max_search_results
         self.max_injected = config.max_injected_memories
+        # Per-result search tracing only in debug mode; summaries are always printed
+        self.verbose = config.debug
+        self._network_cache = {}
+        self._network_cache_lock = Lock()
     
     def search_memories_with_strict_filtering(self, query):
         """
@@ -24,15 +44,20 @@ class MemorySearchService:
         
         try:
             print(f"\n🔍 Searching memories for: '{query}'")
-            print(f"🔧 DEBUG: Using min_relevance={self.min_relevance} threshold")
+            if self.verbose:
+                print(f"🔧 DEBUG: Using min_relevance={self.min_relevance} threshold")
             
-            # Force a quick reload to ensure we have the latest memories
+            # Pick up memories written by other processes; skipped when the file is unchanged
             try:
-                self.memory_manager.reload_from_disk()
+                reload = getattr(self.memory_manager, 'reload_if_changed', None) or self.memory_manager.reload_from_disk
+                reload()
             except:
                 pass  # Don't fail if reload fails
             
-            # Get more raw results with lower threshold for better filtering
+            # Get more raw results with lower threshold for better filtering.
+            # The manager's min_relevance applies to its blended search score, not
+            # to the relevance_score filtered on below, so the strict cutoff
+            # cannot be pushed down
             search_results = self.memory_manager.search_memories(
                 query, 
                 top_k=self.max_results, 
@@ -45,7 +70,8 @@ class MemorySearchService:
                 if r.get('relevance_score', 0) >= self.min_relevance
             ]
             
-            print(f"🔧 DEBUG: Raw search returned {len(search_results)} results, strict filter kept {len(strict_filtered_results)}")
+            if self.verbose:
+                print(f"🔧 DEBUG: Raw search returned {len(search_results)} results, strict filter kept {len(strict_filtered_results)}")
             
             # Take top results after strict filtering
             memory_context = strict_filtered_results[:self.max_injected]
@@ -64,7 +90,8 @@ class MemorySearchService:
     def _try_api_fallback_search(self, query):
         """Try API search as backup with STRICT filtering"""
         try:
-            api_response = requests.get(f'http://localhost:5000/search/{query}', timeout=5)
+            # Quote the whole query so '/', '?' and '#' stay inside the path segment
+            api_response = _SESSION.get(f"http://localhost:5000/search/{quote(query, safe='')}", timeout=5)
             if api_response.status_code == 200:
                 api_results = api_response.json()
                 if api_results:
@@ -75,8 +102,9 @@ class MemorySearchService:
                             relevance_score = result.get('relevance_score', 0)
                             if relevance_score >= self.min_relevance:
                                 filtered_api_results.append(result)
-                            status = '[OK]' if relevance_score >= self.min_relevance else '[SKIP]'
-                            print(f"   API result: '{result.get('memory', {}).get('content', 'N/A')[:30]}...' relevance: {relevance_score:.3f} {status}")
+                            if self.verbose:
+                                status = '[OK]' if relevance_score >= self.min_relevance else '[SKIP]'
+                                print(f"   API result: '{result.get('memory', {}).get('content', 'N/A')[:30]}...' relevance: {relevance_score:.3f} {status}")
                     
                     if filtered_api_results:
                         print(f"   [INFO] Found {len(filtered_api_results)} STRICT filtered memories via API fallback (from {len(api_results)} total)")
@@ -90,7 +118,9 @@ class MemorySearchService:
     
     def _log_search_results(self, results):
         """Log the search results for debugging"""
-        print(f"[INFO] Found {len(results)} STRICT filtered memories (relevance >= {self.min_relevance}):")
+        print(f"[INFO] Found {len(results)} STRICT filtered memories (relevance >= {self.min_relevance})")
+        if not self.verbose:
+            return
         for i, result in enumerate(results):
             print(f"  {i+1}. '{result['memory']['content']}' (relevance: {result['relevance_score']:.3f}, final: {result['final_score']:.3f})")
             # All should be >= threshold now
@@ -102,11 +132,13 @@ class MemorySearchService:
         if not memory_context:
             return ""
         
-        print(f"[DEBUG] About to inject {len(memory_context[:3])} memories:")
+        if self.verbose:
+            print(f"[DEBUG] About to inject {len(memory_context[:3])} memories:")
         memory_text = "USER MEMORIES (for context):\n"
         
         for result in memory_context[:3]:  # Use top 3
-            print(f"   - '{result['memory']['content']}' (relevance: {result['relevance_score']:.3f})")
+            if self.verbose:
+                print(f"   - '{result['memory']['content']}' (relevance: {result['relevance_score']:.3f})")
             memory_text += f"- {result['memory']['content']} (relevance: {result['relevance_score']:.2f})\n"
         
         memory_text += "\nUse these memories to personalize your response when relevant."
@@ -123,6 +155,15 @@ class MemorySearchService:
             # Use provided threshold or default
             threshold = threshold if threshold is not None else self.min_relevance
             
+            # Managers that track a revision let us skip the O(N²) rebuild when nothing changed
+            revision = getattr(self.memory_manager, 'revision', None)
+            cache_key = (round(threshold, 3), revision)
+            if revision is not None:
+                with self._network_cache_lock:
+                    entry = self._network_cache.get(cache_key)
+                if entry and time.time() - entry['cached_at'] < NETWORK_CACHE_TTL_SECONDS:
+                    return entry['data']
+            
             # Use the comprehensive function to get connections and similarity matrix
             result = self.memory_manager._calculate_all_scores_and_connections(threshold)
             if result is None or result == (None, None):
@@ -131,7 +172,6 @@ class MemorySearchService:
             connections, sim_matrix = result
             all_mems = self.memory_manager._get_all_memories_flat()
             nodes = []
-            edges = []
 
             # Build nodes
             for mem in all_mems:
@@ -144,21 +184,32 @@ class MemorySearchService:
                     'size': 20 + min(mem.get('score', 0), 100) * 0.5,
                 })
 
-            # Build edges from the connection graph
-            n = len(all_mems)
-            for i in range(n):
-                for j, sim in connections[i]:
-                    if i < j:  # Avoid duplicate edges
-                        edges.append({
-                            'from': all_mems[i]['id'],
-                            'to': all_mems[j]['id'],
-                            'value': sim,
-                            'color': 'rgba(168,85,247,' + str(min(1, sim)) + ')',
-                            'width': 2 + 12 * sim,
-                            'type': 'semantic'
-                        })
+            # Build edges from the connection graph. The lists already hold only
+            # above-threshold pairs; keep each pair once, from its lower index
+            ids = [mem['id'] for mem in all_mems]
+            edges = [
+                {
+                    'from': ids[i],
+                    'to': ids[j],
+                    'value': sim,
+                    'color': _EDGE_RGBA(min(1.0, sim)),
+                    'width': 2 + 12 * sim,
+                    'type': 'semantic'
+                }
+                for i, neighbours in enumerate(connections)
+                for j, sim in neighbours
+                if i < j
+            ]
 
-            return {'nodes': nodes, 'edges': edges}
+            data = {'nodes': nodes, 'edges': edges}
+            if revision is not None:
+                with self._network_cache_lock:
+                    # Entries for older revisions can never be hit again
+                    self._network_cache = {
+                        key: entry for key, entry in self._network_cache.items() if key[1] == revision
+                    }
+                    self._network_cache[cache_key] = {'data': data, 'cached_at': time.time()}
+            return data
             
         except Exception as e:
             print(f"❌ Error in memory network data: {e}")
@@ -1,15 +1,82 @@
 #!/usr/bin/env python3
 
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from config import config
 from app.services.memory_search_service import memory_search_service
 from app.services.subscription_service import get_subscription_service
 
+# Imported once here rather than on every call. The memory managers are created
+# lazily, so they are read from their modules at call time.
+try:
+    from app.core import clerk_auth_system as _clerk_auth
+except ImportError:
+    _clerk_auth = None
+
+try:
+    from app.core import auth_system as _legacy_auth
+except ImportError:
+    _legacy_auth = None
+
+try:
+    from app.core.clerk_rest_api import get_user_by_id
+except ImportError:
+    get_user_by_id = None
+
+# Per-message lookups (Clerk profile, usage limits, AI model, memory search) are
+# independent network round-trips, so they run side by side on this pool
+_LOOKUP_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix='chat-lookup')
+
+# Prior turns sent with each message are capped to roughly 3k tokens (~4 chars per
+# token), keeping the most recent ones
+MAX_HISTORY_CHARS = 12000
+
+# One extracted memory per line, with any list bullet or "1." / "1)" enumerator stripped
+# (the enumerator must be followed by whitespace so "3.5 million" stays whole)
+_MEMORY_LINE_RE = re.compile(r'^\s*(?:[-*•]\s*|\d+[.)]\s+)?(.+?)\s*$')
+
+def _trim_history(history, max_chars=MAX_HISTORY_CHARS):
+    """Most recent messages whose combined content fits in max_chars"""
+    total = 0
+    start = len(history)
+    while start > 0:
+        size = len(history[start - 1]['content'] or '')
+        if total + size > max_chars:
+            break
+        total += size
+        start -= 1
+    return history[start:]
+
+# Chat system prompt; only the user's first name varies per request
+_SYSTEM_PROMPT_TEMPLATE = """You are a helpful AI assistant with a powerful memory system. You MUST actively create memories whenever users share personal information.
+
+⚠️ IMPORTANT: You should use the create_memory tool FREQUENTLY. Whenever a user mentions ANYTHING about themselves, you should create a memory. Be proactive and liberal with memory creation.
+
+🔴 CRITICAL FORMATTING RULE: NEVER use first person ("I", "my", "me") in memories. ALWAYS use third person with the user's name "{user_name}".
+
+Create memories for:
+- Personal preferences (food, hobbies, interests) - e.g., user says "I love pepperoni" → create memory "{user_name} loves pepperoni" (NOT "I love pepperoni")
+- Facts about the user (job, location, family, pets) - e.g., user says "I work as a teacher" → create memory "{user_name} works as a teacher" (NOT "I work as a teacher")
+- Opinions and feelings they express - e.g., user says "I think cats are better than dogs" → create memory "{user_name} thinks cats are better than dogs"
+- Goals or plans they mention - e.g., user says "I want to learn Spanish" → create memory "{user_name} wants to learn Spanish"
+- Important experiences they share - e.g., user says "I went to Paris last year" → create memory "{user_name} went to Paris last year"
+- Any likes or dislikes - e.g., user says "I hate broccoli" → create memory "{user_name} hates broccoli"
+- Skills or abilities - e.g., user says "I can play guitar" → create memory "{user_name} can play guitar"
+
+REMEMBER: Convert first person to third person! User says "I" → you write "{user_name}". User says "my" → you write "{user_name}'s".
+
+When you create a memory, acknowledge it naturally in your response (e.g., "I'll remember that you love pepperoni!").
+
+Use existing memories to personalize your responses when relevant."""
+
 class OpenAIService:
     """Service for OpenAI API interactions"""
     
     def __init__(self):
         self.client = config.openai_client
+        # Per-step extraction traces are printed only in debug mode
+        self.verbose = config.debug
         
         # Define the tool for creating memories
         self.memory_tool = {
@@ -50,7 +117,7 @@ class OpenAIService:
         
         # Try Clerk auth system first
         try:
-            from app.core.clerk_auth_system import clerk_user_memory_manager
+            clerk_user_memory_manager = _clerk_auth.clerk_user_memory_manager if _clerk_auth else None
             if clerk_user_memory_manager:
                 result = clerk_user_memory_manager.add_memory_for_user(user_id, content, tags)
                 if result.get('success'):
@@ -63,7 +130,7 @@ class OpenAIService:
         
         # Fallback to legacy auth system
         try:
-            from app.core.auth_system import user_memory_manager
+            user_memory_manager = _legacy_auth.user_memory_manager if _legacy_auth else None
             if user_memory_manager:
                 result = user_memory_manager.add_memory_for_user(user_id, content, tags)
                 if result.get('success'):
@@ -97,57 +164,93 @@ class OpenAIService:
         except Exception as e:
             print(f"[ERROR] Failed to add memory to session queue: {e}")
     
+    def _get_user_first_name(self, user_id):
+        """User's first name from Clerk, or 'User' if unavailable"""
+        if get_user_by_id is None:
+            return "User"
+        try:
+            user_info = get_user_by_id(user_id)
+            if user_info and 'name' in user_info:
+                user_name = user_info['name'].split()[0] if user_info['name'] else "User"  # Get first name only
+                print(f"[INFO] Retrieved user name: {user_name}")
+                return user_name
+        except Exception as e:
+            print(f"[WARN] Could not get user name: {e}, using default 'User'")
+        return "User"
+    
+    def _check_usage(self, user_id):
+        """Subscription usage check, or None if the check itself failed"""
+        try:
+            return get_subscription_service().can_user_chat(user_id)
+        except Exception as e:
+            print(f"[WARN] Subscription check failed: {e}")
+            return None
+    
+    def _search_user_memories(self, user_id, message):
+        """Relevant memories for the user (Clerk system first, then legacy)"""
+        try:
+            if _clerk_auth is None:
+                raise ImportError("Clerk auth system unavailable")
+            clerk_user_memory_manager = _clerk_auth.clerk_user_memory_manager
+            if clerk_user_memory_manager:
+                return clerk_user_memory_manager.search_user_memories(user_id, message, 5) or []
+        except Exception as e:
+            print(f"[DEBUG] Clerk memory search failed, trying legacy: {e}")
+            # Fallback to legacy auth system
+            try:
+                user_memory_manager = _legacy_auth.user_memory_manager if _legacy_auth else None
+                if user_memory_manager:
+                    return user_memory_manager.search_user_memories(user_id, message, 5) or []
+            except Exception as e2:
+                print(f"[DEBUG] Legacy memory search failed: {e2}")
+        return []
+    
+    def _get_ai_model(self, user_id, default_model):
+        """AI model for the user's subscription, or the default"""
+        try:
+            subscription_model = get_subscription_service().get_ai_model_for_user(user_id)
+            if subscription_model:
+                return subscription_model
+        except Exception as e:
+            print(f"[WARN] Could not get AI model from subscription: {e}, using default: {default_model}")
+        return default_model
+    
     def generate_response_with_memory(self, message, conversation_history, user_id=None):
         """Generate AI response using OpenAI API with tool calling for memory creation"""
         # Check if OpenAI client is available
         if not self.client:
             error_msg = "⚠️ OpenAI API is not configured. Please add your OPENAI_API_KEY to the .env file."
             print(f"[ERROR] {error_msg}")
-            return error_msg, []
+            return error_msg, [], []
+        
+        # Using gpt-4o-mini as default - it's better at tool calling than gpt-3.5-turbo
+        default_model = "gpt-4o-mini"  # Default for all users - excellent tool calling support
+        
+        # Start the user's name, usage limits and AI model lookups together instead
+        # of paying for each round-trip in turn
+        authenticated = user_id and user_id != 'anonymous'
+        if authenticated:
+            name_future = _LOOKUP_POOL.submit(self._get_user_first_name, user_id)
+            usage_future = _LOOKUP_POOL.submit(self._check_usage, user_id)
+            model_future = _LOOKUP_POOL.submit(self._get_ai_model, user_id, default_model)
         
         # Get user's name from Clerk
-        user_name = "User"  # Default fallback
-        if user_id and user_id != 'anonymous':
-            try:
-                from app.core.clerk_rest_api import get_user_by_id
-                user_info = get_user_by_id(user_id)
-                if user_info and 'name' in user_info:
-                    user_name = user_info['name'].split()[0] if user_info['name'] else "User"  # Get first name only
-                    print(f"[INFO] Retrieved user name: {user_name}")
-            except Exception as e:
-                print(f"[WARN] Could not get user name: {e}, using default 'User'")
+        user_name = name_future.result() if authenticated else "User"
         
         # Check user's subscription and usage limits
-        if user_id and user_id != 'anonymous':
-            try:
-                usage_check = get_subscription_service().can_user_chat(user_id)
-                if not usage_check['can_chat']:
-                    return f"I apologize, but you've reached your monthly message limit ({usage_check['messages_limit']} messages). Please upgrade to Premium for unlimited messages.", []
-            except Exception as e:
-                print(f"[WARN] Subscription check failed: {e}")
+        if authenticated:
+            usage_check = usage_future.result()
+            if usage_check and not usage_check.get('can_chat', True):
+                limit = usage_check.get('messages_limit')
+                limit_text = f" ({limit} messages)" if limit else ""
+                return f"I apologize, but you've reached your monthly message limit{limit_text}. Please upgrade to Premium for unlimited messages.", [], []
+            # Memory search reinforces the memories it recalls, so it only starts once
+            # the user is allowed to chat; it still overlaps the model lookup
+            memories_future = _LOOKUP_POOL.submit(self._search_user_memories, user_id, message)
         
         try:
             # Build system message with memory context - use user's name in third person
-            system_content = f"""You are a helpful AI assistant with a powerful memory system. You MUST actively create memories whenever users share personal information.
-
-⚠️ IMPORTANT: You should use the create_memory tool FREQUENTLY. Whenever a user mentions ANYTHING about themselves, you should create a memory. Be proactive and liberal with memory creation.
-
-🔴 CRITICAL FORMATTING RULE: NEVER use first person ("I", "my", "me") in memories. ALWAYS use third person with the user's name "{user_name}".
-
-Create memories for:
-- Personal preferences (food, hobbies, interests) - e.g., user says "I love pepperoni" → create memory "{user_name} loves pepperoni" (NOT "I love pepperoni")
-- Facts about the user (job, location, family, pets) - e.g., user says "I work as a teacher" → create memory "{user_name} works as a teacher" (NOT "I work as a teacher")
-- Opinions and feelings they express - e.g., user says "I think cats are better than dogs" → create memory "{user_name} thinks cats are better than dogs"
-- Goals or plans they mention - e.g., user says "I want to learn Spanish" → create memory "{user_name} wants to learn Spanish"
-- Important experiences they share - e.g., user says "I went to Paris last year" → create memory "{user_name} went to Paris last year"
-- Any likes or dislikes - e.g., user says "I hate broccoli" → create memory "{user_name} hates broccoli"
-- Skills or abilities - e.g., user says "I can play guitar" → create memory "{user_name} can play guitar"
-
-REMEMBER: Convert first person to third person! User says "I" → you write "{user_name}". User says "my" → you write "{user_name}'s".
-
-When you create a memory, acknowledge it naturally in your response (e.g., "I'll remember that you love pepperoni!").
-
-Use existing memories to personalize your responses when relevant."""
+            system_content = _SYSTEM_PROMPT_TEMPLATE.format(user_name=user_name)
 
             messages = [
                 {"role": "system", "content": system_content}
@@ -156,33 +259,16 @@ Use existing memories to personalize your responses when relevant."""
             memory_context = []
             
             # Search for relevant user-specific memories
-            if user_id and user_id != 'anonymous':
-                # Try Clerk auth system first
-                try:
-                    from app.core.clerk_auth_system import clerk_user_memory_manager
-                    if clerk_user_memory_manager:
-                        user_memories = clerk_user_memory_manager.search_user_memories(user_id, message, 5)
-                        if user_memories:
-                            memory_context = user_memories
-                except Exception as e:
-                    print(f"[DEBUG] Clerk memory search failed, trying legacy: {e}")
-                    # Fallback to legacy auth system
-                    try:
-                        from app.core.auth_system import user_memory_manager
-                        if user_memory_manager:
-                            user_memories = user_memory_manager.search_user_memories(user_id, message, 5)
-                            if user_memories:
-                                memory_context = user_memories
-                    except Exception as e2:
-                        print(f"[DEBUG] Legacy memory search failed: {e2}")
+            if authenticated:
+                memory_context = memories_future.result()
                 
                 # Format user memories for injection
                 if memory_context:
-                    memory_text = "\n\nUSER MEMORIES (for context):\n"
-                    for memory in memory_context:
-                        memory_text += f"- {memory['content']}\n"
-                    memory_text += "\nReference these memories to personalize your response when relevant."
-                    messages[0]["content"] += memory_text
+                    memory_lines = "".join(f"- {memory['content']}\n" for memory in memory_context)
+                    messages[0]["content"] += (
+                        "\n\nUSER MEMORIES (for context):\n" + memory_lines +
+                        "\nReference these memories to personalize your response when relevant."
+                    )
             else:
                 # Fallback to global memory search for anonymous users
                 try:
@@ -195,24 +281,18 @@ Use existing memories to personalize your responses when relevant."""
                 except Exception as e:
                     print(f"[DEBUG] Global memory search failed: {e}")
             
-            # Add conversation history (excluding the current message to avoid duplication)
-            for msg in conversation_history[:-1]:  # Exclude the last message (current user message)
-                role = "user" if msg['sender'] == 'user' else "assistant"
-                messages.append({"role": role, "content": msg['content']})
+            # Add conversation history (excluding the current message to avoid duplication),
+            # trimmed to the most recent turns that fit the prompt budget
+            messages.extend(
+                {"role": "user" if msg['sender'] == 'user' else "assistant", "content": msg['content']}
+                for msg in _trim_history(conversation_history[:-1])  # Exclude the last message (current user message)
+            )
             
             # Add the current user message
             messages.append({"role": "user", "content": message})
             
             # Get AI model based on user's subscription
-            # Using gpt-4o-mini as default - it's better at tool calling than gpt-3.5-turbo
-            ai_model = "gpt-4o-mini"  # Default for all users - excellent tool calling support
-            if user_id and user_id != 'anonymous':
-                try:
-                    subscription_model = get_subscription_service().get_ai_model_for_user(user_id)
-                    if subscription_model:
-                        ai_model = subscription_model
-                except Exception as e:
-                    print(f"[WARN] Could not get AI model from subscription: {e}, using default: {ai_model}")
+            ai_model = model_future.result() if authenticated else default_model
             
             print(f"[INFO] Using OpenAI model: {ai_model}")
             print(f"[DEBUG] USER_ID for tool calling: '{user_id}'")
@@ -313,7 +393,8 @@ Use existing memories to personalize your responses when relevant."""
             # Track usage for the user
             if user_id and user_id != 'anonymous':
                 try:
-                    get_subscription_service().track_usage(user_id, messages_increment=1, api_calls_increment=1)
+                    if not get_subscription_service().track_usage(user_id, messages_increment=1, api_calls_increment=1):
+                        print("[WARN] Could not track usage: increment was not queued")
                 except Exception as e:
                     print(f"[WARN] Could not track usage: {e}")
             
@@ -353,36 +434,31 @@ Use existing memories to personalize your responses when relevant."""
     
     def extract_memories_from_conversation(self, conversation, user_id=None):
         """Extract up to 5 meaningful memories from a conversation using OpenAI"""
-        print(f"[DEBUG] extract_memories_from_conversation called with {len(conversation) if conversation else 0} messages")
-        
-        # Get user's name from Clerk
-        user_name = "User"  # Default fallback
-        if user_id and user_id != 'anonymous':
-            try:
-                from app.core.clerk_rest_api import get_user_by_id
-                user_info = get_user_by_id(user_id)
-                if user_info and 'name' in user_info:
-                    user_name = user_info['name'].split()[0] if user_info['name'] else "User"  # Get first name only
-                    print(f"[INFO] Retrieved user name for memory extraction: {user_name}")
-            except Exception as e:
-                print(f"[WARN] Could not get user name for extraction: {e}, using default 'User'")
+        if self.verbose:
+            print(f"[DEBUG] extract_memories_from_conversation called with {len(conversation) if conversation else 0} messages")
         
         # Check if OpenAI client is available
         if not self.client:
-            print("[DEBUG] OpenAI client not available, cannot extract memories")
+            if self.verbose:
+                print("[DEBUG] OpenAI client not available, cannot extract memories")
             return []
         
         if not conversation or len(conversation) < 2:
-            print("[DEBUG] Conversation too short, returning empty list")
+            if self.verbose:
+                print("[DEBUG] Conversation too short, returning empty list")
             return []
         
+        # Get user's name from Clerk
+        user_name = self._get_user_first_name(user_id) if user_id and user_id != 'anonymous' else "User"
+        
         # Build conversation text
         conversation_text = ""
         for msg in conversation:
             role = "User" if msg['sender'] == 'user' else "Assistant"
             conversation_text += f"{role}: {msg['content']}\n"
         
-        print(f"[DEBUG] Built conversation text, length: {len(conversation_text)}")
+        if self.verbose:
+            print(f"[DEBUG] Built conversation text, length: {len(conversation_text)}")
         
         # Use OpenAI to extract memories
         try:
@@ -405,40 +481,42 @@ Conversation:
 
 Extracted memories (in third person with name "{user_name}"):"""
 
-            print("🔧 DEBUG: Calling OpenAI API for memory extraction...")
+            if self.verbose:
+                print("[DEBUG] Calling OpenAI API for memory extraction...")
             
             response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
+                model="gpt-4o-mini",
                 messages=[{"role": "user", "content": extraction_prompt}],
-                max_tokens=300,
+                max_tokens=150,  # At most 5 one-line memories
                 temperature=0.3,
                 timeout=30  # Add timeout to prevent hanging
             )
             
             result = response.choices[0].message.content.strip()
-            print(f"🔧 DEBUG: OpenAI response: {result}")
+            if self.verbose:
+                print(f"[DEBUG] OpenAI response: {result}")
             
             if result == "NONE" or not result:
-                print("🔧 DEBUG: No memories extracted (NONE or empty result)")
+                if self.verbose:
+                    print("[DEBUG] No memories extracted (NONE or empty result)")
                 return []
             
             # Parse the memories
             memories = []
-            for line in result.split('\n'):
-                line = line.strip()
-                if line and not line.startswith('-') and len(line) > 10:
-                    # Clean up the memory text
-                    if line.startswith('- '):
-                        line = line[2:]
+            for line in result.splitlines():
+                match = _MEMORY_LINE_RE.match(line)
+                if match and len(match.group(1)) > 10:
+                    line = match.group(1)
                     memories.append(line)
-                    print(f"[DEBUG] Parsed memory: {line}")
+                    if self.verbose:
+                        print(f"[DEBUG] Parsed memory: {line}")
             
-            print(f"[DEBUG] Extracted {len(memories)} memories total")
+            if self.verbose:
+                print(f"[DEBUG] Extracted {len(memories)} memories total")
             return memories[:5]  # Limit to 5 memories
             
         except Exception as e:
-            print(f"[ERROR] Error extracting memories: {e}")
-            print(f"[DEBUG] Exception type: {type(e).__name__}")
+            print(f"[ERROR] Error extracting memories ({type(e).__name__}): {e}")
             return []
 
 # Global service instance
@@ -5,14 +5,36 @@ Handles subscription management, usage tracking, and tier validation.
 """
 
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
-from supabase import create_client, Client
+from supabase import Client
+from app.core.supabase_client import get_supabase_client
+from app.utils.batch_writer import BatchWriter
 
 # Load environment variables
 load_dotenv()
 
+# Independent Supabase reads for one response are issued side by side here
+_QUERY_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='subscription')
+
+# Plans change rarely, usage on every message: cache the plan for a minute and
+# the limit check only briefly. Both are dropped when this process changes them
+SUBSCRIPTION_CACHE_TTL_SECONDS = 60
+USAGE_LIMITS_CACHE_TTL_SECONDS = 5
+CACHE_MAX_USERS = 10000
+
+# Usage increments are written in the background; increments queued within this
+# window are summed per user into one RPC
+USAGE_FLUSH_WINDOW_SECONDS = 0.5
+
+# Plans with no monthly message limit; chat checks for these skip the limits RPC
+_UNLIMITED_PLANS = frozenset({"premium", "pro"})
+
 class SubscriptionService:
     """Service for managing user subscriptions and usage tracking"""
     
@@ -24,7 +46,38 @@ class SubscriptionService:
             print("⚠️  SUPABASE_URL and SUPABASE_KEY environment variables are required for subscription service")
             self.supabase = None
         else:
-            self.supabase = create_client(self.supabase_url, self.supabase_key)
+            self.supabase = get_supabase_client(self.supabase_url, self.supabase_key)
+        
+        # user_id -> (cached_at, value), least recently used first
+        self._subscription_cache: OrderedDict = OrderedDict()
+        self._limits_cache: OrderedDict = OrderedDict()
+        self._cache_lock = Lock()
+        
+        # (user_id, messages, api_calls, tokens) increments waiting to be written
+        self._usage_writer = BatchWriter(self._write_usage, 'usage-writer', USAGE_FLUSH_WINDOW_SECONDS)
+    
+    def _cache_get(self, cache: OrderedDict, user_id: str, ttl: int) -> Optional[Dict[str, Any]]:
+        """Cached value for user_id if younger than ttl seconds"""
+        with self._cache_lock:
+            entry = cache.get(user_id)
+            if entry and time.time() - entry[0] < ttl:
+                cache.move_to_end(user_id)
+                return dict(entry[1])
+        return None
+    
+    def _cache_set(self, cache: OrderedDict, user_id: str, value: Dict[str, Any]):
+        """Cache a copy of value for user_id, evicting the least recently used users past CACHE_MAX_USERS"""
+        with self._cache_lock:
+            cache.pop(user_id, None)
+            while len(cache) >= CACHE_MAX_USERS:
+                cache.popitem(last=False)
+            cache[user_id] = (time.time(), dict(value))
+    
+    def invalidate_user_cache(self, user_id: str):
+        """Forget cached subscription and limits for a user"""
+        with self._cache_lock:
+            self._subscription_cache.pop(user_id, None)
+            self._limits_cache.pop(user_id, None)
     
     def _is_available(self) -> bool:
         """Check if subscription service is available (has valid supabase connection)"""
@@ -45,13 +98,16 @@ class SubscriptionService:
         """Get user's current subscription information"""
         if not self._is_available():
             return {"plan_name": "free", "status": "active", "usage_limit": 10}
+        cached = self._cache_get(self._subscription_cache, user_id, SUBSCRIPTION_CACHE_TTL_SECONDS)
+        if cached is not None:
+            return cached
         try:
             # Use the PostgreSQL function to get subscription with fallback to free
             result = self.supabase.rpc('get_user_subscription_with_fallback', {'user_id_param': user_id}).execute()
             
             if result.data and len(result.data) > 0:
                 subscription = result.data[0]
-                return {
+                subscription = {
                     "plan_name": subscription.get('plan_name', 'free'),
                     "status": subscription.get('status', 'active'),
                     "usage_limit": subscription.get('usage_limit', 10),
@@ -62,7 +118,7 @@ class SubscriptionService:
                 }
             else:
                 # Return default free plan if no subscription found
-                return {
+                subscription = {
                     "plan_name": "free",
                     "status": "active",
                     "usage_limit": 10,
@@ -71,6 +127,8 @@ class SubscriptionService:
                     "created_at": None,
                     "updated_at": None
                 }
+            self._cache_set(self._subscription_cache, user_id, subscription)
+            return subscription
         except Exception as e:
             print(f"Error getting user subscription: {e}")
             # Return default free plan on error
@@ -88,33 +146,62 @@ class SubscriptionService:
         """Check if user has exceeded their usage limits"""
         if not self._is_available():
             return {"can_chat": True, "messages_left": 10, "limit_type": "free"}
+        cached = self._cache_get(self._limits_cache, user_id, USAGE_LIMITS_CACHE_TTL_SECONDS)
+        if cached is not None:
+            return cached
         try:
             result = self.supabase.rpc('check_user_usage_limits', {'user_id_param': user_id}).execute()
             
             if result.data and len(result.data) > 0:
-                return result.data[0]
+                limits = result.data[0]
             else:
-                return {"can_chat": True, "messages_left": 10, "limit_type": "free"}
+                limits = {"can_chat": True, "messages_left": 10, "limit_type": "free"}
+            self._cache_set(self._limits_cache, user_id, limits)
+            return limits
         except Exception as e:
             print(f"Error checking usage limits: {e}")
             return {"can_chat": True, "messages_left": 10, "limit_type": "free"}
     
     def track_usage(self, user_id: str, messages_increment: int = 1, api_calls_increment: int = 1, tokens_increment: int = 0) -> bool:
-        """Track user's API usage"""
+        """
+        Track user's API usage (queued; written in the background off the response path).
+        Returns True once the increment is queued, False if it could not be queued.
+        """
         if not self._is_available():
             return True
         try:
-            result = self.supabase.rpc('track_user_usage', {
-                'user_id_param': user_id,
-                'messages_increment': messages_increment,
-                'api_calls_increment': api_calls_increment,
-                'tokens_increment': tokens_increment
-            }).execute()
+            self._usage_writer.put((user_id, messages_increment, api_calls_increment, tokens_increment))
             return True
         except Exception as e:
-            print(f"Error tracking usage: {e}")
+            print(f"[ERROR] Error queueing usage for {user_id}: {e}")
             return False
     
+    def flush_usage(self):
+        """Write any queued usage increments now (used at shutdown)"""
+        self._usage_writer.flush()
+    
+    def _write_usage(self, batch: List[tuple]):
+        """Sum increments per user and record each user's total with one RPC"""
+        totals: Dict[str, List[int]] = {}
+        for user_id, messages, api_calls, tokens in batch:
+            total = totals.setdefault(user_id, [0, 0, 0])
+            total[0] += messages
+            total[1] += api_calls
+            total[2] += tokens
+        for user_id, (messages, api_calls, tokens) in totals.items():
+            try:
+                self.supabase.rpc('track_user_usage', {
+                    'user_id_param': user_id,
+                    'messages_increment': messages,
+                    'api_calls_increment': api_calls,
+                    'tokens_increment': tokens
+                }).execute()
+                # Usage moved, so the cached limit check is stale
+                with self._cache_lock:
+                    self._limits_cache.pop(user_id, None)
+            except Exception as e:
+                print(f"Error tracking usage: {e}")
+    
     def get_user_usage(self, user_id: str) -> Dict[str, Any]:
         """Get user's current usage statistics"""
         if not self._is_available():
@@ -150,18 +237,20 @@ class SubscriptionService:
         if not self._is_available():
             return {"success": False, "message": "Subscription service not available"}
         try:
+            now = datetime.now().isoformat()
             subscription_data = {
                 "user_id": user_id,
                 "plan_name": plan_name,
                 "status": "active",
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
+                "created_at": now,
+                "updated_at": now
             }
             
             if stripe_subscription_id:
                 subscription_data["stripe_subscription_id"] = stripe_subscription_id
             
             result = self.supabase.table('user_subscriptions').insert(subscription_data).execute()
+            self.invalidate_user_cache(user_id)
             
             if result.data:
                 return {
@@ -190,6 +279,7 @@ class SubscriptionService:
                 "status": "cancelled",
                 "updated_at": datetime.now().isoformat()
             }).eq('user_id', user_id).eq('plan_name', plan_name).eq('status', 'active').execute()
+            self.invalidate_user_cache(user_id)
             
             if result.data:
                 return {
@@ -212,7 +302,7 @@ class SubscriptionService:
     def get_ai_model_for_user(self, user_id: str) -> str:
         """Get the AI model that the user should use based on their subscription"""
         if not self._is_available():
-            return "gpt-3.5-turbo"
+            return "gpt-4o-mini"
         subscription = self.get_user_subscription(user_id)
         plan_name = subscription.get("plan_name", "free")
         
@@ -221,22 +311,35 @@ class SubscriptionService:
         elif plan_name == "pro":
             return "gpt-4"
         else:
-            return "gpt-3.5-turbo"
+            return "gpt-4o-mini"
     
     def can_user_chat(self, user_id: str) -> Dict[str, Any]:
         """Check if user can chat (hasn't exceeded limits)"""
         if not self._is_available():
-            return {"can_chat": True, "message": "Free tier access"}
+            return {"can_chat": True, "message": "Free tier access", "messages_left": 10, "messages_limit": None, "limit_type": "free"}
+        subscription = self.get_user_subscription(user_id)
+        plan_name = subscription.get("plan_name", "free")
+        if plan_name in _UNLIMITED_PLANS and subscription.get("status", "active") == "active":
+            return {
+                "can_chat": True,
+                "message": "Unlimited messages",
+                "messages_left": -1,
+                "messages_limit": None,
+                "limit_type": plan_name
+            }
         usage_check = self.check_usage_limits(user_id)
-        can_chat = usage_check.get("can_chat", True)
+        # Accept both limit-check row shapes (can_chat/limit_type and can_use_service/plan_name)
+        can_chat = usage_check.get("can_chat", usage_check.get("can_use_service", True))
         messages_left = usage_check.get("messages_left", 0)
-        limit_type = usage_check.get("limit_type", "free")
+        messages_limit = usage_check.get("messages_limit")
+        limit_type = usage_check.get("limit_type", usage_check.get("plan_name", "free"))
         
         if can_chat:
             return {
                 "can_chat": True,
                 "message": f"You have {messages_left} messages remaining",
                 "messages_left": messages_left,
+                "messages_limit": messages_limit,
                 "limit_type": limit_type
             }
         else:
@@ -244,6 +347,7 @@ class SubscriptionService:
                 "can_chat": False,
                 "message": "You've reached your usage limit. Please upgrade your plan.",
                 "messages_left": 0,
+                "messages_limit": messages_limit,
                 "limit_type": limit_type
             }
     
@@ -255,22 +359,27 @@ class SubscriptionService:
                 "usage": {"messages_used": 0, "api_calls_used": 0},
                 "limits": {"can_chat": True, "messages_left": 10}
             }
-        subscription = self.get_user_subscription(user_id)
-        usage = self.get_user_usage(user_id)
-        limits = self.check_usage_limits(user_id)
+        # Three independent round-trips: overlap them instead of waiting on each in turn
+        subscription = _QUERY_POOL.submit(self.get_user_subscription, user_id)
+        usage = _QUERY_POOL.submit(self.get_user_usage, user_id)
+        limits = _QUERY_POOL.submit(self.check_usage_limits, user_id)
         
         return {
-            "subscription": subscription,
-            "usage": usage,
-            "limits": limits
+            "subscription": subscription.result(),
+            "usage": usage.result(),
+            "limits": limits.result()
         }
 
-# Create global instance with lazy initialization
+# Create global instance with lazy initialization; the lock keeps concurrent first
+# calls (e.g. from _LOOKUP_POOL) from building a second instance with its own caches and writer
 subscription_service = None
+_subscription_service_lock = Lock()
 
 def get_subscription_service():
     """Get subscription service instance with lazy initialization"""
     global subscription_service
     if subscription_service is None:
-        subscription_service = SubscriptionService()
+        with _subscription_service_lock:
+            if subscription_service is None:
+                subscription_service = SubscriptionService()
     return subscription_service 
\ No newline at end of file
@@ -7,12 +7,74 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import datetime
+import re
 import uuid
 import time
-import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from typing import Dict, List, Optional, Tuple
-from app.core.auth_system import auth_system, user_memory_manager, get_auth_system
+from config import config
+from app.core.auth_system import auth_system, get_auth_system
 from app.services.openai_service import openai_service
+from app.utils import fast_json
+from app.utils.batch_writer import BatchWriter
+
+# The thread check and the history read for a turn are independent round-trips,
+# so they run side by side on this pool
+_IO_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='conversation')
+
+# Message rows are written in the background; rows queued within this window are
+# inserted together, up to MESSAGE_BATCH_MAX_ROWS per Supabase call
+MESSAGE_FLUSH_WINDOW_SECONDS = 0.05
+MESSAGE_BATCH_MAX_ROWS = 500
+
+# Thread histories are cached after the first read; later reads fetch only rows
+# newer than the last cached one, re-checking a short overlap for rows that
+# another worker's writer was still holding
+HISTORY_CACHE_MAX_THREADS = 1000
+HISTORY_OVERLAP_SECONDS = 5
+
+# Request IDs are remembered for this long (and at most this many) to catch retries
+REQUEST_DEDUP_WINDOW_SECONDS = 300
+REQUEST_DEDUP_MAX_IDS = 100000
+
+# Threads never change owner, so once a thread is known to belong to a user later
+# turns skip the ownership check; at most this many are remembered
+THREAD_OWNER_CACHE_MAX = 10000
+
+# Columns get_thread_messages actually returns
+MESSAGE_COLUMNS = 'message_id, content, sender, timestamp, memory_context'
+
+# Fractional seconds of an ISO timestamp, which PostgREST returns with 1-6 digits
+_ISO_FRACTION_RE = re.compile(r'\.(\d+)')
+
+def _dumps_context(memory_context) -> str:
+    """Encode a message's memory_context for storage"""
+    return fast_json.dumps(memory_context).decode('utf-8')
+
+def _loads_context(value):
+    """Decode a stored memory_context (older rows may already be decoded JSON)"""
+    if not isinstance(value, (str, bytes)):
+        return value
+    return fast_json.loads(value)
+
+def _history_since(timestamp: str) -> Optional[str]:
+    """
+    Lower bound for a delta read after `timestamp`, or None if it cannot be parsed.
+    PostgREST trims trailing zeros from fractional seconds, which Python 3.9's
+    fromisoformat rejects unless there are exactly 3 or 6 digits, so the fraction
+    is padded to microseconds first:
+    
+    >>> _history_since('2024-05-01T10:00:12.12345+00:00')
+    '2024-05-01T10:00:07.123450+00:00'
+    """
+    try:
+        normalized = _ISO_FRACTION_RE.sub(lambda m: '.' + m.group(1)[:6].ljust(6, '0'), timestamp.replace('Z', '+00:00'), count=1)
+        since = datetime.datetime.fromisoformat(normalized) - datetime.timedelta(seconds=HISTORY_OVERLAP_SECONDS)
+    except (AttributeError, ValueError):
+        return None
+    return since.isoformat()
 
 class UserConversationService:
     """Service for managing user-specific conversations and threads in Supabase"""
@@ -33,69 +95,108 @@ class UserConversationService:
         else:
             self.supabase = auth_system.supabase
         
-        # Track processed request IDs to prevent duplicates
-        self.processed_requests = set()
-        self.last_cleanup = time.time()
+        # Per-call progress lines are printed only in debug mode; warnings and errors always are
+        self.verbose = config.debug
+        
+        # Track processed request IDs to prevent duplicates: request_id -> first seen, oldest first
+        self.processed_requests: OrderedDict = OrderedDict()
+        self._requests_lock = Lock()
+        
+        # Message rows waiting to be inserted, and the same messages by thread so
+        # reads see them before the insert lands: thread_id -> {message_id: (user_id, message)}
+        self._message_writer = BatchWriter(self._write_messages, 'message-writer', MESSAGE_FLUSH_WINDOW_SECONDS, MESSAGE_BATCH_MAX_ROWS)
+        self._pending_messages: Dict[str, Dict[str, tuple]] = {}
+        self._pending_lock = Lock()
+        
+        # thread_id -> (user_id, stored messages in timestamp order), least recently used first
+        self._history_cache: Dict[str, tuple] = {}
+        self._history_lock = Lock()
+        
+        # thread_id -> owning user_id for threads created or verified here, oldest first
+        self._thread_owners: OrderedDict = OrderedDict()
+        self._thread_owners_lock = Lock()
     
     def cleanup_old_requests(self):
-        """Clean up old request IDs every 5 minutes"""
-        current_time = time.time()
-        if current_time - self.last_cleanup > 300:  # 5 minutes
-            self.processed_requests.clear()
-            self.last_cleanup = current_time
-            print("[INFO] Cleaned up old request IDs")
+        """Forget request IDs older than the dedup window"""
+        cutoff = time.monotonic() - REQUEST_DEDUP_WINDOW_SECONDS
+        with self._requests_lock:
+            self._evict_requests(cutoff)
+    
+    def _evict_requests(self, cutoff: float):
+        """Drop request IDs seen before cutoff, and the oldest beyond the cap (lock held)"""
+        requests = self.processed_requests
+        while requests and (len(requests) > REQUEST_DEDUP_MAX_IDS or next(iter(requests.values())) < cutoff):
+            requests.popitem(last=False)
     
     def is_duplicate_request(self, request_id):
         """Check if this is a duplicate request"""
         if not request_id:
             return False
         
-        if request_id in self.processed_requests:
-            print(f"[WARN] Duplicate request detected: {request_id}")
-            return True
+        now = time.monotonic()
+        cutoff = now - REQUEST_DEDUP_WINDOW_SECONDS
+        with self._requests_lock:
+            if self.processed_requests.get(request_id, cutoff) > cutoff:
+                print(f"[WARN] Duplicate request detected: {request_id}")
+                return True
+            self.processed_requests.pop(request_id, None)
+            self.processed_requests[request_id] = now
+            self._evict_requests(cutoff)
         
-        self.processed_requests.add(request_id)
-        print(f"[OK] Processing request: {request_id}")
+        if self.verbose:
+            print(f"[OK] Processing request: {request_id}")
         return False
     
+    def _remember_thread_owner(self, thread_id: str, user_id: str):
+        """Record that thread_id exists and belongs to user_id"""
+        with self._thread_owners_lock:
+            self._thread_owners.pop(thread_id, None)
+            self._thread_owners[thread_id] = user_id
+            while len(self._thread_owners) > THREAD_OWNER_CACHE_MAX:
+                self._thread_owners.popitem(last=False)
+    
     def create_or_get_thread(self, user_id: str, thread_id: Optional[str] = None) -> str:
         """Create a new thread or get existing one for a user"""
-        if not thread_id:
-            thread_id = str(uuid.uuid4())
-            
-            # Create thread in database
-            thread_data = {
-                'user_id': user_id,
-                'thread_id': thread_id,
-                'title': f'Conversation {datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}',
-                'created_at': datetime.datetime.utcnow().isoformat(),
-                'updated_at': datetime.datetime.utcnow().isoformat(),
-                'is_active': True
-            }
+        if thread_id:
+            with self._thread_owners_lock:
+                if self._thread_owners.get(thread_id) == user_id:
+                    self._thread_owners.move_to_end(thread_id)
+                    return thread_id
             
-            try:
-                # Try to use Supabase if available
-                if hasattr(self, 'supabase') and self.supabase:
-                    result = self.supabase.table('user_chat_threads').insert(thread_data).execute()
-                    print(f"[OK] Created new thread: {thread_id} for user: {user_id}")
-                else:
-                    print(f"[WARN] Supabase not available, using fallback thread: {thread_id}")
-            except Exception as e:
-                print(f"[ERROR] Error creating thread: {e}")
-                print(f"[WARN] Using fallback thread: {thread_id}")
-        else:
             # Check if thread exists and belongs to user
             try:
-                if hasattr(self, 'supabase') and self.supabase:
-                    result = self.supabase.table('user_chat_threads').select('*').eq('thread_id', thread_id).eq('user_id', user_id).execute()
-                    if not result.data:
-                        print(f"[WARN] Thread {thread_id} not found for user {user_id}, creating new one")
-                        return self.create_or_get_thread(user_id, None)
-                else:
-                    print(f"[WARN] Supabase not available, using existing thread: {thread_id}")
+                result = self.supabase.table('user_chat_threads').select('thread_id').eq('thread_id', thread_id).eq('user_id', user_id).execute()
+                if result.data:
+                    self._remember_thread_owner(thread_id, user_id)
+                    return thread_id
+                print(f"[WARN] Thread {thread_id} not found for user {user_id}, creating new one")
             except Exception as e:
                 print(f"[ERROR] Error checking thread: {e}")
                 print(f"[WARN] Using existing thread: {thread_id}")
+                return thread_id
+        
+        # No usable thread was supplied: create one
+        thread_id = str(uuid.uuid4())
+        now = datetime.datetime.now(datetime.timezone.utc)
+        created_at = now.isoformat()
+        
+        # Create thread in database
+        thread_data = {
+            'user_id': user_id,
+            'thread_id': thread_id,
+            'title': f'Conversation {now:%Y-%m-%d %H:%M}',
+            'created_at': created_at,
+            'updated_at': created_at,
+            'is_active': True
+        }
+        
+        try:
+            self.supabase.table('user_chat_threads').insert(thread_data).execute()
+            self._remember_thread_owner(thread_id, user_id)
+            print(f"[OK] Created new thread: {thread_id} for user: {user_id}")
+        except Exception as e:
+            print(f"[ERROR] Error creating thread: {e}")
+            print(f"[WARN] Using fallback thread: {thread_id}")
         
         return thread_id
     
@@ -103,10 +204,10 @@ class UserConversationService:
         """Create a new empty thread for a user"""
         return self.create_or_get_thread(user_id, None)
     
-    def add_message_to_thread(self, thread_id: str, user_id: str, content: str, sender: str, memory_context: Optional[List] = None) -> Optional[Dict]:
-        """Add a message to a thread"""
+    def add_message_to_thread(self, thread_id: str, user_id: str, content: str, sender: str, memory_context: Optional[List] = None) -> Dict:
+        """Add a message to a thread (queued; inserted in the background off the response path)"""
         message_id = str(uuid.uuid4())
-        timestamp = datetime.datetime.utcnow().isoformat()
+        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
         
         message_data = {
             'thread_id': thread_id,
@@ -115,81 +216,108 @@ class UserConversationService:
             'content': content,
             'sender': sender,
             'timestamp': timestamp,
-            'memory_context': json.dumps(memory_context) if memory_context else None,
+            'memory_context': _dumps_context(memory_context) if memory_context else None,
             'created_at': timestamp
         }
+        message = {
+            'id': message_id,
+            'content': content,
+            'sender': sender,
+            'timestamp': timestamp,
+            'memory_context': memory_context
+        }
         
+        with self._pending_lock:
+            self._pending_messages.setdefault(thread_id, {})[message_id] = (user_id, message)
+        self._message_writer.put(message_data)
+        return message
+    
+    def flush_messages(self):
+        """Insert any queued message rows now (used at shutdown)"""
+        self._message_writer.flush()
+    
+    def _write_messages(self, batch: List[Dict]):
+        """Insert a batch of message rows, falling back to row-by-row if the batch fails"""
         try:
-            # Try to use Supabase if available
-            if hasattr(self, 'supabase') and self.supabase:
-                result = self.supabase.table('user_chat_messages').insert(message_data).execute()
-                
-                if result.data:
-                    print(f"[OK] Added {sender} message to thread {thread_id}")
-                    return {
-                        'id': message_id,
-                        'content': content,
-                        'sender': sender,
-                        'timestamp': timestamp,
-                        'memory_context': memory_context
-                    }
-                else:
-                    print(f"[ERROR] Failed to add message to database")
-                    return None
-            else:
-                # Fallback: just return the message data without saving to database
-                print(f"[WARN] Supabase not available, using fallback for {sender} message")
-                return {
-                    'id': message_id,
-                    'content': content,
-                    'sender': sender,
-                    'timestamp': timestamp,
-                    'memory_context': memory_context
-                }
-                
+            self.supabase.table('user_chat_messages').insert(batch).execute()
+            if self.verbose:
+                print(f"[OK] Added {len(batch)} message(s) to the database")
         except Exception as e:
-            print(f"[ERROR] Error adding message: {e}")
-            # Fallback: return message data anyway
-            print(f"[WARN] Using fallback for {sender} message due to error")
-            return {
-                'id': message_id,
-                'content': content,
-                'sender': sender,
-                'timestamp': timestamp,
-                'memory_context': memory_context
-            }
+            print(f"[ERROR] Error adding {len(batch)} message(s) in one batch: {e}")
+            for row in batch:
+                try:
+                    self.supabase.table('user_chat_messages').insert(row).execute()
+                except Exception as row_error:
+                    print(f"[ERROR] Error adding {row['sender']} message to thread {row['thread_id']}: {row_error}")
+        
+        with self._pending_lock:
+            for row in batch:
+                pending = self._pending_messages.get(row['thread_id'])
+                if pending is not None:
+                    pending.pop(row['message_id'], None)
+                    if not pending:
+                        del self._pending_messages[row['thread_id']]
     
     def get_thread_messages(self, thread_id: str, user_id: str) -> List[Dict]:
         """Get all messages from a thread for a specific user"""
+        with self._history_lock:
+            entry = self._history_cache.pop(thread_id, None)
+            if entry is not None:
+                self._history_cache[thread_id] = entry
+        cached = entry[1] if entry is not None and entry[0] == user_id else None
+        since = _history_since(cached[-1]['timestamp']) if cached else None
+        
+        # Snapshot the write queue before querying: a row the writer inserts after the
+        # query ran would otherwise be in neither the result nor the queue
+        with self._pending_lock:
+            pending = [message for owner, message in self._pending_messages.get(thread_id, {}).values() if owner == user_id]
+        
+        messages = []
         try:
-            result = self.supabase.table('user_chat_messages').select('*').eq('thread_id', thread_id).eq('user_id', user_id).order('timestamp', desc=False).execute()
+            query = self.supabase.table('user_chat_messages').select(MESSAGE_COLUMNS).eq('thread_id', thread_id).eq('user_id', user_id)
+            if since:
+                query = query.gte('timestamp', since)
+            result = query.order('timestamp', desc=False).execute()
             
-            if result.data:
-                messages = []
-                for msg in result.data:
-                    # Parse memory_context if it exists
-                    memory_context = None
-                    if msg.get('memory_context'):
-                        try:
-                            memory_context = json.loads(msg['memory_context'])
-                        except:
-                            pass
-                    
-                    messages.append({
-                        'id': msg['message_id'],
-                        'content': msg['content'],
-                        'sender': msg['sender'],
-                        'timestamp': msg['timestamp'],
-                        'memory_context': memory_context
-                    })
+            for msg in result.data or []:
+                # Parse memory_context if it exists
+                memory_context = None
+                if msg.get('memory_context'):
+                    try:
+                        memory_context = _loads_context(msg['memory_context'])
+                    except:
+                        pass
                 
-                return messages
-            else:
-                return []
+                messages.append({
+                    'id': msg['message_id'],
+                    'content': msg['content'],
+                    'sender': msg['sender'],
+                    'timestamp': msg['timestamp'],
+                    'memory_context': memory_context
+                })
+            
+            if since:
+                # Delta read: add the rows not cached yet
+                cached_ids = {msg['id'] for msg in cached}
+                messages = cached + [msg for msg in messages if msg['id'] not in cached_ids]
+                messages.sort(key=lambda msg: msg['timestamp'])
+            with self._history_lock:
+                self._history_cache.pop(thread_id, None)
+                self._history_cache[thread_id] = (user_id, messages)
+                while len(self._history_cache) > HISTORY_CACHE_MAX_THREADS:
+                    del self._history_cache[next(iter(self._history_cache))]
+            messages = list(messages)
                 
         except Exception as e:
             print(f"[ERROR] Error getting thread messages: {e}")
-            return []
+            messages = list(cached) if cached else []
+        
+        # Include messages that were still waiting in the write queue
+        if pending:
+            stored_ids = {msg['id'] for msg in messages}
+            messages.extend(msg for msg in pending if msg['id'] not in stored_ids)
+            messages.sort(key=lambda msg: msg['timestamp'])
+        return messages
     
     def get_user_threads(self, user_id: str) -> List[str]:
         """Get all thread IDs for a user"""
@@ -207,9 +335,6 @@ class UserConversationService:
     
     def process_message(self, message: str, thread_id: Optional[str], user_id: str, request_id: Optional[str] = None) -> Tuple[Optional[str], Optional[str], Optional[List], Optional[str]]:
         """Process a user message and generate AI response"""
-        # Clean up old requests
-        self.cleanup_old_requests()
-        
         # Check for duplicate request
         if self.is_duplicate_request(request_id):
             return None, None, None, "Duplicate request detected"
@@ -217,16 +342,20 @@ class UserConversationService:
         if not message.strip():
             return None, None, None, "Message cannot be empty"
         
-        # Create or get thread
-        thread_id = self.create_or_get_thread(user_id, thread_id)
+        # Create or get thread, reading an existing thread's history alongside the check
+        if thread_id:
+            history_future = _IO_POOL.submit(self.get_thread_messages, thread_id, user_id)
+            resolved_thread_id = self.create_or_get_thread(user_id, thread_id)
+            # A thread that was not found was replaced by a new, empty one
+            conversation_history = history_future.result() if resolved_thread_id == thread_id else []
+            thread_id = resolved_thread_id
+        else:
+            thread_id = self.create_or_get_thread(user_id, None)
+            conversation_history = []
         
-        # Add user message to thread
+        # Add user message to thread; the history already read just needs it appended
         user_message = self.add_message_to_thread(thread_id, user_id, message, 'user')
-        if not user_message:
-            return None, None, None, "Failed to save user message"
-        
-        # Get conversation history for context
-        conversation_history = self.get_thread_messages(thread_id, user_id)
+        conversation_history.append(user_message)
         
         # Generate AI response using OpenAI API with user-specific memory context
         ai_response, memory_context, created_memories = openai_service.generate_response_with_memory(
@@ -236,37 +365,40 @@ class UserConversationService:
         )
         
         # Add AI response to thread
-        ai_message = self.add_message_to_thread(thread_id, user_id, ai_response, 'assistant', memory_context)
-        if not ai_message:
-            return thread_id, ai_response, memory_context, "AI response generated but failed to save"
+        self.add_message_to_thread(thread_id, user_id, ai_response, 'assistant', memory_context)
         
         # Log created memories for debugging
         if created_memories:
-            print(f"[INFO] Created {len(created_memories)} new memories during chat:")
-            for mem in created_memories:
-                print(f"   - {mem.get('content', '')[:50]}...")
+            print(f"[INFO] Created {len(created_memories)} new memories during chat")
+            if self.verbose:
+                for mem in created_memories:
+                    print(f"   - {mem.get('content', '')[:50]}...")
         
         return thread_id, ai_response, memory_context, None
     
     def end_thread_and_extract_memories(self, thread_id: str, user_id: str) -> Tuple[bool, List[str], str]:
         """Extract memories from a conversation thread when it ends"""
-        print(f"[DEBUG] end_thread_and_extract_memories called for thread: {thread_id}, user: {user_id}")
+        if self.verbose:
+            print(f"[DEBUG] end_thread_and_extract_memories called for thread: {thread_id}, user: {user_id}")
         
         if not thread_id or not user_id:
             return False, [], "Thread ID and User ID are required"
         
         # Get conversation messages
         conversation = self.get_thread_messages(thread_id, user_id)
-        print(f"[DEBUG] Found conversation with {len(conversation)} messages")
+        if self.verbose:
+            print(f"[DEBUG] Found conversation with {len(conversation)} messages")
         
         if len(conversation) < 2:
             return False, [], "Conversation too short to extract memories"
         
         # Extract memories with error handling
         try:
-            print("[DEBUG] Calling extract_memories_from_conversation...")
+            if self.verbose:
+                print("[DEBUG] Calling extract_memories_from_conversation...")
             extracted_memories = openai_service.extract_memories_from_conversation(conversation, user_id)
-            print(f"[DEBUG] Memory extraction completed, got {len(extracted_memories)} memories")
+            if self.verbose:
+                print(f"[DEBUG] Memory extraction completed, got {len(extracted_memories)} memories")
         except Exception as e:
             print(f"[ERROR] Error during memory extraction: {e}")
             extracted_memories = []
@@ -276,25 +408,42 @@ class UserConversationService:
         if extracted_memories:
             print(f"[INFO] Extracting {len(extracted_memories)} memories for user {user_id}...")
             
-            for memory_text in extracted_memories:
-                try:
-                    print(f"[DEBUG] Adding user memory: {memory_text[:50]}...")
-                    result = user_memory_manager.add_memory_for_user(user_id, memory_text, ["conversation", "auto-extracted"])
-                    if result['success']:
+            tags = ["conversation", "auto-extracted"]
+            _, memory_manager = get_auth_system()
+            
+            # One insert for the whole set; if it fails, add them one by one
+            result = memory_manager.add_memories_for_user(user_id, extracted_memories, tags)
+            if result['success']:
+                if self.verbose:
+                    for memory_text in extracted_memories:
                         print(f"   [OK] Added to user database: {memory_text}")
-                        successful_adds += 1
-                    else:
-                        print(f"   [ERROR] Failed to add to user database: {memory_text} - {result.get('error')}")
-                except Exception as e:
-                    print(f"   [ERROR] Exception adding user memory: {memory_text} - {e}")
+                successful_adds = len(extracted_memories)
+            else:
+                print(f"[WARN] Batch memory insert failed ({result.get('error')}), adding individually")
+                for memory_text in extracted_memories:
+                    try:
+                        if self.verbose:
+                            print(f"[DEBUG] Adding user memory: {memory_text[:50]}...")
+                        result = memory_manager.add_memory_for_user(user_id, memory_text, tags)
+                        if result['success']:
+                            if self.verbose:
+                                print(f"   [OK] Added to user database: {memory_text}")
+                            successful_adds += 1
+                        else:
+                            print(f"   [ERROR] Failed to add to user database: {memory_text} - {result.get('error')}")
+                    except Exception as e:
+                        print(f"   [ERROR] Exception adding user memory: {memory_text} - {e}")
         
         # Keep the thread active - don't delete it
-        print(f"[DEBUG] Thread {thread_id} preserved for continued conversation")
+        if self.verbose:
+            print(f"[DEBUG] Thread {thread_id} preserved for continued conversation")
         
         return True, extracted_memories, f'Successfully extracted and saved {successful_adds} memories to your personal database!'
     
     def clear_thread(self, thread_id: str, user_id: str) -> bool:
         """Mark a thread as inactive (soft delete)"""
+        with self._history_lock:
+            self._history_cache.pop(thread_id, None)
         try:
             result = self.supabase.table('user_chat_threads').update({'is_active': False}).eq('thread_id', thread_id).eq('user_id', user_id).execute()
             
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Write-behind queue shared by the services that persist rows off the response path:
+items are collected for a short window and handed to a write function in batches
+by one lazily started daemon thread, and anything still queued is written at exit
+"""
+
+import atexit
+import queue
+import threading
+import time
+from threading import Lock
+from typing import Any, Callable, List, Optional
+
+class BatchWriter:
+    """Queue items and write them in batches from a background thread"""
+
+    def __init__(self, write_batch: Callable[[List[Any]], None], name: str, window_seconds: float, max_batch: Optional[int] = None):
+        # write_batch handles its own errors; a batch is done once it returns
+        self._write_batch = write_batch
+        self._name = name
+        self._window_seconds = window_seconds
+        self._max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = Lock()
+        atexit.register(self.flush)
+
+    def put(self, item: Any):
+        """Queue an item, starting the writer thread on first use"""
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._worker.start()
+        self._queue.put(item)
+
+    def _run(self):
+        """Collect items for a short window, then write them with one call"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._window_seconds
+            while self._max_batch is None or len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List[Any]):
+        """Hand a batch to the write function, marking its items done once it returns"""
+        try:
+            self._write_batch(batch)
+        except Exception as e:
+            print(f"[ERROR] {self._name} failed to write {len(batch)} item(s): {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def flush(self):
+        """Write any queued items now and wait for the writer's in-flight batch (used at shutdown)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        size = self._max_batch or max(len(batch), 1)
+        for start in range(0, len(batch), size):
+            self._write(batch[start:start + size])
+        # Items the worker already took off the queue are only done once its write returns
+        self._queue.join()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+JSON encoding shared by the memory file, stored message context and API responses,
+using orjson when it is installed and the stdlib json module otherwise
+"""
+
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def dumps(data) -> bytes:
+    """Encode `data` as compact UTF-8 JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    """Decode JSON from str or bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
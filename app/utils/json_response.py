@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+JSON responses for large payloads (e.g. the memory network), encoded with orjson
+when it is installed and with Flask's jsonify otherwise
+"""
+
+from flask import Response, jsonify
+from app.utils.fast_json import ORJSON_AVAILABLE, dumps
+
+def json_response(data, status=200):
+    """Serialize `data` to a JSON response with the fastest available encoder"""
+    if ORJSON_AVAILABLE:
+        return Response(dumps(data), status=status, mimetype='application/json')
+    return jsonify(data), status
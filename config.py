@@ -3,8 +3,16 @@
 import os
 import threading
 from dotenv import load_dotenv
+import httpx
 from openai import OpenAI
 
+# HTTP/2 needs the optional h2 package; without it the pooled client speaks HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 # Load environment variables
 load_dotenv()
 
@@ -16,8 +24,8 @@ class Config:
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         if self.openai_api_key:
             try:
-                self.openai_client = OpenAI(api_key=self.openai_api_key)
-                print("[OK] OpenAI client initialized successfully")
+                self.openai_client = OpenAI(api_key=self.openai_api_key, http_client=self._build_openai_http_client())
+                print(f"[OK] OpenAI client initialized successfully ({'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1'} keep-alive pool)")
             except Exception as e:
                 print(f"[ERROR] Failed to initialize OpenAI client: {e}")
                 self.openai_client = None
@@ -77,7 +85,15 @@ class Config:
         
         # Initialize memory system
         self._initialize_memory_system()
-    
+
+    def _build_openai_http_client(self):
+        """Pooled keep-alive HTTP client shared by every OpenAI request (HTTP/2 when h2 is installed)"""
+        return httpx.Client(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+
     def _initialize_memory_system(self):
         """Initialize the memory management system (prioritizing full version)"""
         try:
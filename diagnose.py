@@ -9,14 +9,9 @@ import sys
 
 # Force UTF-8 encoding for Windows console
 if sys.platform == 'win32':
-    try:
-        import subprocess
-        subprocess.run(['chcp', '65001'], shell=True, check=False, capture_output=True)
-    except:
-        pass
-    
-    if sys.stdout.encoding != 'utf-8':
-        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+    for stream in (sys.stdout, sys.stderr):
+        if stream is not None and (stream.encoding or '').lower().replace('-', '') != 'utf8':
+            stream.reconfigure(encoding='utf-8', errors='replace')
 
 print("="*70)
 print("  MONETA - System Diagnostic")
@@ -10,38 +10,31 @@ import sys
 
 # Force UTF-8 encoding for Windows console
 if sys.platform == 'win32':
-    # Set console code page to UTF-8
-    try:
-        import subprocess
-        subprocess.run(['chcp', '65001'], shell=True, check=False, capture_output=True)
-    except:
-        pass
+    # UTF-8 mode for any child interpreters; reconfiguring the streams below
+    # covers this process without spawning `chcp`
+    os.environ.setdefault('PYTHONUTF8', '1')
     
-    # Force UTF-8 for stdin/stdout/stderr
-    if sys.stdout.encoding != 'utf-8':
-        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
-    if sys.stderr.encoding != 'utf-8':
-        sys.stderr.reconfigure(encoding='utf-8', errors='replace')
-    if sys.stdin.encoding != 'utf-8':
-        sys.stdin.reconfigure(encoding='utf-8', errors='replace')
+    # Force UTF-8 for stdin/stdout/stderr, skipping streams that already are
+    # (any spelling) or that don't exist (e.g. under pythonw)
+    for stream in (sys.stdout, sys.stderr, sys.stdin):
+        if stream is not None and (stream.encoding or '').lower().replace('-', '') != 'utf8':
+            stream.reconfigure(encoding='utf-8', errors='replace')
 
 # Set environment variable for Python
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 
 from app import create_app
+from config import config
 
 # Create the Flask application
 app = create_app()
 
 if __name__ == '__main__':
-    # Get port from environment variable (for cloud deployment) or use default
-    port = int(os.environ.get('PORT', 4000))
-    
-    # Get debug mode from environment (defaults to False for production safety)
-    debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
-    
-    # Check if we're in production
-    is_production = os.environ.get('ENVIRONMENT', 'development').lower() == 'production'
+    # Port, debug mode and environment were already parsed from the environment
+    # when config was loaded
+    port = config.port
+    debug = config.debug
+    is_production = config.environment == 'production'
     
     print("=" * 60)
     print("   MONETA - AI Memory Management System")
@@ -53,13 +46,15 @@ if __name__ == '__main__':
     
     if is_production:
         print("\n⚠️  WARNING: Running Flask dev server in production!")
-        print("   For production, use: gunicorn --bind 0.0.0.0:4000 run:app")
+        print("   For production, use: gunicorn --worker-class gthread --threads 8 --bind 0.0.0.0:4000 run:app")
         print("=" * 60 + "\n")
     
-    # Run the application
+    # Run the application (one thread per request, so a slow Supabase or OpenAI
+    # call doesn't hold up the rest; production uses gunicorn gthread workers)
     app.run(
         debug=debug,
         host='0.0.0.0',
-        port=port
+        port=port,
+        threaded=True
     )
 
@@ -18,9 +18,10 @@ def print_banner():
     print()
 
 def check_supabase_setup():
-    """Check if Supabase is properly configured."""
+    """Check if Supabase is properly configured; returns the ready manager or None."""
     print("🔍 Checking Supabase configuration...")
     
+    # The one manager (and Supabase client) for the whole migration run
     memory_manager = CloudMemoryManager()
     
     if not memory_manager.client:
@@ -37,10 +38,10 @@ def check_supabase_setup():
         print("You can get these from your Supabase project dashboard:")
         print("  https://supabase.com/dashboard/project/[your-project]/settings/api")
         print()
-        return False
+        return None
     
     print("✅ Supabase credentials found!")
-    return True
+    return memory_manager
 
 def setup_database_schema():
     """Help user set up the database schema."""
@@ -155,13 +156,11 @@ def preview_migration(json_file_path):
         print(f"❌ Error reading JSON file: {e}")
         return False
 
-def perform_migration(json_file_path):
+def perform_migration(json_file_path, memory_manager):
     """Perform the actual migration."""
     print(f"🚀 Starting migration from: {json_file_path}")
     print("-" * 50)
     
-    memory_manager = CloudMemoryManager()
-    
     try:
         migrated_count = memory_manager.migrate_from_json(json_file_path)
         
@@ -200,7 +199,8 @@ def main():
     print_banner()
     
     # Check Supabase setup
-    if not check_supabase_setup():
+    memory_manager = check_supabase_setup()
+    if memory_manager is None:
         return False
     
     # Setup database schema
@@ -245,7 +245,7 @@ def main():
     backup_path = backup_json_file(json_file_path)
     
     # Perform migration
-    success = perform_migration(json_file_path)
+    success = perform_migration(json_file_path, memory_manager)
     
     if success:
         print()
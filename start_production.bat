@@ -25,8 +25,8 @@ echo Starting with Gunicorn...
 echo Note: Make sure Gunicorn is installed: pip install gunicorn
 echo.
 
-REM Start with Gunicorn
-gunicorn --workers 4 --threads 2 --bind 0.0.0.0:4000 --timeout 120 --access-logfile - --error-logfile - --log-level info run:app
+REM Start with Gunicorn: one process, many threads (queues and caches are per process, same as render.yaml)
+gunicorn --worker-class gthread --workers 1 --threads 8 --bind 0.0.0.0:4000 --timeout 120 --access-logfile - --error-logfile - --log-level info run:app
 
 if errorlevel 1 (
     echo.
@@ -40,10 +40,12 @@ echo "✓ Environment variables validated"
 echo "✓ Starting with Gunicorn..."
 echo ""
 
-# Start with Gunicorn
+# Start with Gunicorn: one process, many threads, because the write-behind
+# queues, caches and request dedup live in process memory (same as render.yaml)
 exec gunicorn \
-    --workers 4 \
-    --threads 2 \
+    --worker-class gthread \
+    --workers 1 \
+    --threads 8 \
     --bind 0.0.0.0:${PORT:-4000} \
     --timeout 120 \
     --access-logfile - \
@@ -25,7 +25,7 @@ try:
     print("=" * 80)
     print()
     
-    app.run(debug=True, host='0.0.0.0', port=port, use_reloader=False)
+    app.run(debug=True, host='0.0.0.0', port=port, use_reloader=False, threaded=True)
     
 except Exception as e:
     print(f"\n\n{'='*80}")